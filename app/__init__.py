@@ -1,8 +1,6 @@
 # Flask imports
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from flask_apscheduler import APScheduler
 from flask_login import LoginManager
 from flask_moment import Moment
 
@@ -14,25 +12,58 @@ import os
 # Configuration
 from config import Config
 
-app = Flask(__name__)                       # Flask app instantiation
-app.config.from_object(Config)              # Configuration variables
-db = SQLAlchemy(app)                        # Flask SQLAlchemy
-migrate = Migrate(app, db)                  # Flask SQLAlchemy database migrations
-login = LoginManager(app)                   # Flask login authenticator
-moment = Moment(app)                        # Flask Local Timezone conversion
-scheduler = APScheduler()                   # Flask APScheduler instantiation
-scheduler.init_app(app)                     # Flask APScheduler added to Flask app
-scheduler.start()                           # Flask APScheduler started
-
-# Logging via Rotating File Handler
-if not app.debug:
-    if not os.path.exists('logs'):
-        os.mkdir('logs')
-    file_handler = RotatingFileHandler('logs/mirc-data-dashboard.log', maxBytes=10240, backupCount=10)
-    file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.setLevel(logging.INFO)
-    app.logger.info('MIRC Data Dashboard startup')
-
-from app import routes, models, errors
\ No newline at end of file
+# Database engines with read/write routing
+from app.engines import RoutingSQLAlchemy
+
+# Extensions are bound to an app by create_app()
+db = RoutingSQLAlchemy()                    # Flask SQLAlchemy, reads outside write transactions use a read-only engine
+migrate = Migrate()                         # Flask SQLAlchemy database migrations
+login = LoginManager()                      # Flask login authenticator
+moment = Moment()                           # Flask Local Timezone conversion
+
+def create_app(config_class=Config):        # Application factory - Bokeh, Dropbox and SendGrid load on first use, the NDT7 sync scheduler is started by main.py
+    app = Flask(__name__)                   # Flask app instantiation
+    app.config.from_object(config_class)    # Configuration variables
+
+    db.init_app(app)
+    from app.search import include_object
+    migrate.init_app(app, db, include_object=include_object)    # The forum search index is not a model
+    login.init_app(app)
+    moment.init_app(app)
+
+    # Rendered plot cache, last seen buffer and email queue of this app
+    from app.graph import render_cache
+    from app.activity import last_seen
+    from app.email import mail
+    render_cache.init_app(app)
+    last_seen.init_app(app)
+    mail.init_app(app)
+
+    # Blueprints
+    from app.routes import bp as main_bp
+    from app.api import bp as api_bp
+    from app.errors import bp as errors_bp
+    from app.metrics import bp as metrics_bp
+    from app.cli import bp as cli_bp
+    from app.assets import bp as assets_bp
+    app.register_blueprint(main_bp)
+    app.register_blueprint(api_bp)
+    app.register_blueprint(errors_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(cli_bp)
+    app.register_blueprint(assets_bp)
+
+    # Logging via Rotating File Handler
+    if not app.debug and not app.testing:
+        if not os.path.exists('logs'):
+            os.mkdir('logs')
+        file_handler = RotatingFileHandler('logs/mirc-data-dashboard.log', maxBytes=10240, backupCount=10)
+        file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
+        app.logger.setLevel(logging.INFO)
+        app.logger.info('MIRC Data Dashboard startup')
+
+    return app
+
+from app import models
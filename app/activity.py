@@ -0,0 +1,66 @@
+# Write-behind buffer of users' last seen times - requests only update memory and a background thread
+# writes the pending times in one batch every LAST_SEEN_FLUSH_SECONDS, or sooner once LAST_SEEN_MAX_PENDING users are waiting
+from app import db
+from app.models import User
+
+# Helper libraries
+import atexit
+import threading
+from datetime import datetime
+from sqlalchemy import bindparam
+
+class LastSeenBuffer(object):
+    def __init__(self, interval=60, max_pending=500):
+        self.app = None
+        self.interval = interval            # Seconds a time may wait in memory
+        self.max_pending = max_pending      # Pending users that trigger an early flush
+        self.pending = {}                   # user id -> latest request time in UTC
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def init_app(self, app):        # Takes the LAST_SEEN_* settings, pending times are written through this app
+        self.app = app
+        self.interval = app.config['LAST_SEEN_FLUSH_SECONDS']
+        self.max_pending = app.config['LAST_SEEN_MAX_PENDING']
+
+    def touch(self, user_id):       # Records a request of the user, the flush thread starts with the first one
+        with self.lock:
+            self.pending[user_id] = datetime.utcnow()
+            if len(self.pending) >= self.max_pending:
+                self.wake.set()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='last-seen', daemon=True)
+                self.thread.start()
+
+    def seen(self, user):           # Last seen time of a user including a pending one
+        with self.lock:
+            return self.pending.get(user.id, user.last_seen)
+
+    def flush(self):                # Writes pending times in one transaction, returns how many
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+
+        table = User.__table__
+        update = table.update().where(table.c.id == bindparam('user_id')).values(last_seen=bindparam('seen'))
+        try:
+            with self.app.app_context(), db.engine.begin() as connection:
+                connection.execute(update, [{'user_id': k, 'seen': v} for k, v in pending.items()])
+        except Exception:
+            self.app.logger.exception('Failed to write last seen times of %d users', len(pending))
+            with self.lock:         # Kept for the next flush unless the user was seen again meanwhile
+                for user_id, seen in pending.items():
+                    self.pending.setdefault(user_id, seen)
+            return 0
+        return len(pending)
+
+    def run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.flush()
+
+last_seen = LastSeenBuffer()            # Configured by create_app()
+atexit.register(last_seen.flush)        # Pending times are written on a clean shutdown
@@ -0,0 +1,162 @@
+# JSON data API - columnar NDT7 measurements for client-side charts and monitoring scripts
+from app.ndt7 import TCP_INFO
+from app.queries import DIRECTIONS, measurements, throughput, last_ingest
+from app.rollups import ROLLUP_METRICS, RESOLUTIONS, series
+from app.series import COLUMNS, test_series, throughput as test_throughput
+
+# Flask
+from flask import Blueprint, request, jsonify, make_response
+
+# Helper libraries
+import gzip
+import json
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from hashlib import md5
+
+# Selectable fields - TCPInfo columns, the direction's transferred 'bytes' and the derived 'throughput' (Mbit/s)
+API_FIELDS = ['bytes', 'throughput'] + list(TCP_INFO)
+DEFAULT_FIELDS = ['throughput', 'min_rtt', 'rtt']
+
+bp = Blueprint('api', __name__)
+
+def api_error(message, status=400):
+    return make_response(jsonify(error=message), status)
+
+def parse_time(value, name):    # ISO 8601 date or datetime query argument as a naive UTC datetime, times with an offset are converted
+    try:
+        time = datetime.fromisoformat(value)
+        if time.tzinfo is not None:
+            time = time.astimezone(timezone.utc).replace(tzinfo=None)
+    except (TypeError, ValueError, OverflowError):     # Offsets can move the first and last representable days out of range
+        raise ValueError('{} must be an ISO 8601 date or datetime'.format(name))
+    return time
+
+def column(values):             # JSON array of a float metric, whole numbers stay integers and NaN becomes null
+    if values.size and np.all(np.isnan(values) | (values == np.floor(values))):
+        return [None if v is None else int(v) for v in np.where(np.isnan(values), None, values).tolist()]
+    return np.where(np.isnan(values), None, np.round(values, 3)).tolist()
+
+def conditional_response(*key):     # Response with cache validators that follow the latest ingestion
+    modified = last_ingest()
+    etag = md5('|'.join(str(k) for k in key + (request.path, modified)).encode('utf-8')).hexdigest()
+    response = make_response('')
+    response.set_etag(etag)
+    if modified is not None:
+        response.last_modified = modified
+    response.cache_control.no_cache = True
+    response.vary.add('Accept-Encoding')
+    return response.make_conditional(request)
+
+def send_json(response, body):      # Compact JSON body, gzip compressed when the client accepts it
+    payload = json.dumps(body, separators=(',', ':')).encode('utf-8')
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        payload = gzip.compress(payload, compresslevel=6)
+        response.headers['Content-Encoding'] = 'gzip'
+    response.set_data(payload)
+    response.mimetype = 'application/json'
+    return response
+
+def parse_range():      # start and end query arguments, end defaults to one day after start
+    start = parse_time(request.args.get('start'), 'start')
+    if 'end' in request.args:
+        end = parse_time(request.args['end'], 'end')
+    elif start > datetime.max - timedelta(days=1):
+        raise ValueError('start must be before 9999-12-31 when end is not given')
+    else:
+        end = start + timedelta(days=1)
+    if end <= start:
+        raise ValueError('end must be after start')
+    return start, end
+
+def parse_directions():
+    direction = request.args.get('direction', 'both')
+    if direction not in ('both', 'download', 'upload'):
+        raise ValueError('direction must be download, upload or both')
+    return list(DIRECTIONS) if direction == 'both' else [direction]
+
+def parse_fields(allowed, default):     # Comma separated 'fields' query argument
+    fields = request.args.get('fields')
+    fields = fields.split(',') if fields else default
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError('unknown fields: {}'.format(', '.join(unknown)))
+    return fields
+
+@bp.route('/api/v1/measurements')
+def api_measurements():
+    try:
+        start, end = parse_range()
+        directions = parse_directions()
+        fields = parse_fields(API_FIELDS, DEFAULT_FIELDS)
+    except ValueError as e:
+        return api_error(str(e))
+
+    # Unchanged data is answered with a 304 before querying
+    response = conditional_response(start, end, directions, fields)
+    if response.status_code == 304:
+        return response
+
+    # Throughput is derived from the transferred bytes and elapsed time
+    query = [f for f in fields if f != 'throughput']
+    if 'throughput' in fields:
+        query += [f for f in ('bytes', 'elapsed_time') if f not in query]
+
+    body = {'start': start.isoformat(), 'end': end.isoformat()}
+    for d in directions:
+        data = measurements(d, start, end, query)
+        columns = {'timestamp': data['timestamp'].astype('datetime64[ms]').astype(np.int64).tolist()}     # Epoch milliseconds
+        for field in fields:
+            columns[field] = column(throughput(data) if field == 'throughput' else data[field])
+        body[d] = columns
+
+    return send_json(response, body)
+
+@bp.route('/api/v1/rollups')
+def api_rollups():      # Hourly or daily summaries - count, mean, min, max, p50, p90 and p99 per metric
+    try:
+        start, end = parse_range()
+        directions = parse_directions()
+        fields = parse_fields(ROLLUP_METRICS, ROLLUP_METRICS)
+        resolution = request.args.get('resolution', 'day')
+        if resolution not in RESOLUTIONS:
+            raise ValueError('resolution must be hour or day')
+    except ValueError as e:
+        return api_error(str(e))
+
+    response = conditional_response(start, end, resolution, directions, fields)
+    if response.status_code == 304:
+        return response
+
+    body = {'start': start.isoformat(), 'end': end.isoformat(), 'resolution': resolution}
+    for d in directions:
+        body[d] = {}
+        for metric in fields:
+            rows = series(resolution, d, metric, start, end)
+            columns = {'period': np.array([r.period for r in rows], dtype='datetime64[ms]').astype(np.int64).tolist()}     # Epoch milliseconds of each bucket
+            for stat in ('count', 'mean', 'min', 'max', 'p50', 'p90', 'p99'):
+                columns[stat] = [getattr(r, stat) for r in rows]
+            body[d][metric] = columns
+    return send_json(response, body)
+
+@bp.route('/api/v1/tests/<filename>')
+def api_test(filename):     # Every server measurement of one test - elapsed time, bytes, throughput, round trip times and retransmissions
+    test = test_series(filename)
+    if test is None:
+        return api_error('no sample series for {}'.format(filename), 404)
+    direction, columns = test
+
+    response = make_response('')
+    response.set_etag(filename)     # Stored series never change
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    response.vary.add('Accept-Encoding')
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+
+    body = {'filename': filename, 'direction': direction, 'samples': len(columns['elapsed_time'])}
+    for name, _ in COLUMNS:
+        body[name] = columns[name].tolist()
+    body['throughput'] = column(test_throughput(columns))
+    return send_json(response, body)
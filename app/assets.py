@@ -0,0 +1,49 @@
+# BokehJS served by the app itself - dashboards load no scripts from cdn.bokeh.org and work without internet access
+# URLs carry the Bokeh version, so browsers cache the files for a year, and gzip variants are compressed once to ASSET_CACHE_DIR
+from flask import Blueprint, current_app, request, send_file, abort
+
+# Helper libraries
+import gzip
+import os
+from werkzeug.security import safe_join
+
+bp = Blueprint('assets', __name__)
+
+ONE_YEAR = 365 * 24 * 3600      # Cache lifetime of versioned files in seconds
+
+# File type -> MIME type of the served files
+MIMETYPES = {
+    '.js': 'application/javascript',
+    '.css': 'text/css',
+    '.map': 'application/json'
+}
+
+def compressed(path, name):     # Gzip variant of 'path' in the asset cache, written on first use
+    target = os.path.join(current_app.config['ASSET_CACHE_DIR'], name + '.gz')
+    if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(path):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = '{}.{}.tmp'.format(target, os.getpid())
+        with open(path, 'rb') as src, gzip.open(tmp, 'wb', compresslevel=9) as dst:
+            dst.write(src.read())
+        os.replace(tmp, target)             # Atomic, other workers never serve a partial file
+    return target
+
+@bp.route('/bokeh/<version>/static/<path:filename>')
+def bokeh_static(version, filename):
+    from bokeh import __version__
+    from bokeh.util.paths import bokehjsdir
+
+    mimetype = MIMETYPES.get(os.path.splitext(filename)[1])
+    path = safe_join(bokehjsdir(), filename)
+    if version != __version__ or mimetype is None or path is None or not os.path.isfile(path):
+        abort(404)
+
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = send_file(compressed(path, os.path.join('bokeh-' + version, filename)), mimetype=mimetype, conditional=True, max_age=ONE_YEAR)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_file(path, mimetype=mimetype, conditional=True, max_age=ONE_YEAR)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
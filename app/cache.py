@@ -0,0 +1,86 @@
+# Size-bounded LRU cache of rendered pages, kept in memory and on disk
+# Entries are keyed by (name, date, data version) so new data for a date never serves a stale render
+
+# Helper libraries
+import glob
+import os
+import threading
+from collections import OrderedDict
+
+class RenderCache(object):
+    def __init__(self, directory=None, max_entries=64, max_bytes=256 * 1024 * 1024):
+        self.directory = directory          # Disk cache location shared by every worker process
+        self.max_entries = max_entries      # In-memory entries kept by this process
+        self.max_bytes = max_bytes          # Total size of the disk cache
+        self.memory = OrderedDict()         # key -> rendered HTML, least recently used first
+        self.lock = threading.Lock()
+
+    def init_app(self, app):                # Takes the location and sizes from the RENDER_CACHE_* settings
+        self.directory = app.config['RENDER_CACHE_DIR']
+        self.max_entries = app.config['RENDER_CACHE_ENTRIES']
+        self.max_bytes = app.config['RENDER_CACHE_BYTES']
+
+    def path(self, name, date, version):    # Disk location of an entry
+        return os.path.join(self.directory, '{}-{}-{}.html'.format(date, version, name))
+
+    def get(self, name, date, version):     # Rendered HTML of an entry or None on a miss
+        key = (name, date, version)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+
+        path = self.path(name, date, version)
+        try:
+            with open(path, encoding='utf-8') as f:
+                html = f.read()
+            os.utime(path)                  # Modification time doubles as the disk LRU clock
+        except OSError:
+            return None
+        self.remember(key, html)
+        return html
+
+    def put(self, name, date, version, html):   # Stores an entry and evicts old versions and least recently used entries
+        self.remember((name, date, version), html)
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(name, date, version)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(html)
+        os.replace(tmp, path)               # Atomic, readers never see a partial file
+
+        # Older versions of the same date are unreachable once new data arrives
+        for old in glob.glob(self.path(name, date, '*')):
+            if old != path:
+                self.remove(old)
+        self.evict()
+
+    def remember(self, key, html):          # In-memory LRU insert
+        with self.lock:
+            self.memory[key] = html
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_entries:
+                self.memory.popitem(last=False)
+
+    def evict(self):                        # Removes least recently used files until the disk cache fits 'max_bytes'
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, '*.html')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+        except OSError:             # Already removed by another worker
+            pass
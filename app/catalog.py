@@ -0,0 +1,75 @@
+# Available-dates catalog - per-day NDT7 test counts served from an in-process cache
+# Ingestion maintains the MeasurementDay rows, the cache is invalidated by invalidate() in the ingesting process
+# and by the last_ingest generation in every other process
+from app import db
+from app.models import MeasurementDay, Download, Upload, SyncState
+from app.queries import LAST_INGEST_KEY
+
+# Helper libraries
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+# Date of NDT7 measurements as YYYY, MM, DD strings with its download and upload test counts
+Day = namedtuple('Day', ['year', 'month', 'day', 'downloads', 'uploads'])
+
+_lock = threading.Lock()
+_cache = (None, None)   # (ingestion generation, catalog) - the catalog is reloaded when the generation changes
+
+def generation():       # Value that changes whenever any process stores new tests
+    state = SyncState.query.get(LAST_INGEST_KEY)
+    return state.value if state is not None else None
+
+def available_dates():      # Dates with NDT7 measurements in ascending order
+    global _cache
+    current = generation()      # Single primary key lookup, ingestion may run in another process
+    cached, dates = _cache
+    if dates is None or cached != current:
+        days = MeasurementDay.query.filter((MeasurementDay.downloads > 0) | (MeasurementDay.uploads > 0)) \
+            .order_by(MeasurementDay.date).all()
+        dates = [Day(d.date.strftime('%Y'), d.date.strftime('%m'), d.date.strftime('%d'), d.downloads, d.uploads) for d in days]
+        with _lock:
+            _cache = (current, dates)
+    return dates
+
+def invalidate():           # Drops the cached catalog so the next request reloads it
+    global _cache
+    with _lock:
+        _cache = (None, None)
+
+def add_tests(direction, rows):     # Counts newly stored tests and bumps the data version of their dates
+    counts = {}
+    for row in rows:
+        date = row['timestamp'].date()
+        counts[date] = counts.get(date, 0) + 1
+
+    days = {day.date: day for day in MeasurementDay.query.filter(MeasurementDay.date.in_(counts))}
+    for date, count in counts.items():
+        if date not in days:
+            days[date] = MeasurementDay(date=date, version=0, downloads=0, uploads=0)
+            db.session.add(days[date])
+        day = days[date]
+        day.version += 1
+        setattr(day, direction + 's', (getattr(day, direction + 's') or 0) + count)
+
+def rebuild():          # Recounts the catalog from the raw measurements, keeping existing data versions
+    counts = {}
+    for direction, model in (('downloads', Download), ('uploads', Upload)):
+        day = db.func.date(model.timestamp)
+        for date, count in db.session.query(day, db.func.count()).filter(model.timestamp != None).group_by(day):
+            date = datetime.strptime(str(date)[:10], '%Y-%m-%d').date()
+            counts.setdefault(date, {'downloads': 0, 'uploads': 0})[direction] = count
+
+    days = {day.date: day for day in MeasurementDay.query.all()}
+    for date, day in days.items():
+        if date not in counts:
+            day.downloads = day.uploads = 0
+    for date, count in counts.items():
+        if date not in days:
+            days[date] = MeasurementDay(date=date, version=1)
+            db.session.add(days[date])
+        days[date].downloads = count['downloads']
+        days[date].uploads = count['uploads']
+    db.session.commit()
+    invalidate()
+    return len(counts)
@@ -0,0 +1,202 @@
+# Flask command line interface - run with 'flask <command>' from the project's root directory
+# Sync commands load the Dropbox SDK when they run, not with every command
+from app import db
+from app.models import Download, Upload
+from app import rollups, catalog, journal, metrics, forum, search
+from flask import Blueprint, current_app
+
+# Helper libraries
+import click
+import time
+from contextlib import contextmanager
+
+bp = Blueprint('cli', __name__, cli_group=None)     # Commands are registered at the top level of 'flask'
+
+# Measurement columns carried over unchanged from the year/month/day/time schema
+LEGACY_COLUMNS = [
+    'id', 'filename', 'client_ip', 'server_ip', 'busy_time', 'bytes_acked', 'bytes_received', 'bytes_sent',
+    'bytes_retrans', 'elapsed_time', 'min_rtt', 'rtt', 'rtt_var', 'rwnd_limited', 'snd_buf_limited'
+]
+
+def dedupe(connection, table):      # Deletes all but the first stored row of each filename, returns how many
+    return connection.execute(db.text(
+        'DELETE FROM {0} WHERE filename IS NOT NULL AND id NOT IN '
+        '(SELECT MIN(id) FROM {0} WHERE filename IS NOT NULL GROUP BY filename)'.format(table))).rowcount
+
+@bp.cli.command('dedupe-measurements')
+def dedupe_measurements():      # Removes duplicate NDT7 files stored by concurrent syncs before filename becomes unique
+    for model in (Download, Upload):
+        table = model.__tablename__
+        if table not in db.inspect(db.engine).get_table_names():
+            continue
+        with db.engine.begin() as conn:
+            removed = dedupe(conn, table)
+        click.echo('{}: removed {} duplicate rows'.format(table, removed))
+
+@contextmanager
+def ddl_transaction():      # Connection in one transaction that also covers DDL - pysqlite commits before DDL unless the transaction is begun by hand
+    if db.engine.dialect.name != 'sqlite':
+        with db.engine.begin() as conn:
+            yield conn
+        return
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT', autocommit=False) as conn:
+        conn.exec_driver_sql('BEGIN')
+        try:
+            yield conn
+        except BaseException:
+            conn.exec_driver_sql('ROLLBACK')
+            raise
+        conn.exec_driver_sql('COMMIT')
+
+def copy_legacy(conn, model):       # Copies the first row of each filename from <table>_legacy into the timestamp schema, returns (copied, skipped)
+    table = model.__tablename__
+    legacy = table + '_legacy'
+
+    # SQLite stores DateTime as 'YYYY-MM-DD HH:MM:SS.ffffff' text, other backends need an explicit cast
+    timestamp = "year || '-' || month || '-' || day || ' ' || time || '.000000'"
+    if conn.dialect.name != 'sqlite':
+        timestamp = "CAST({} AS TIMESTAMP)".format(timestamp.replace(" || '.000000'", ''))
+
+    # Ids are kept unless rows were stored in the new table since an interrupted run
+    columns = LEGACY_COLUMNS
+    if conn.execute(db.text('SELECT COUNT(*) FROM {}'.format(table))).scalar():
+        columns = [c for c in LEGACY_COLUMNS if c != 'id']
+    columns = ', '.join(columns)
+
+    total = conn.execute(db.text('SELECT COUNT(*) FROM {}'.format(legacy))).scalar()
+    copied = conn.execute(db.text(
+        'INSERT INTO {0} ({2}, timestamp) SELECT {2}, {3} FROM {1} '
+        'WHERE (filename IS NULL OR id IN (SELECT MIN(id) FROM {1} WHERE filename IS NOT NULL GROUP BY filename)) '
+        'AND (filename IS NULL OR filename NOT IN (SELECT filename FROM {0} WHERE filename IS NOT NULL))'
+        .format(table, legacy, columns, timestamp))).rowcount
+    conn.execute(db.text('DROP TABLE {}'.format(legacy)))
+    return copied, total - copied
+
+@bp.cli.command('upgrade-measurements')
+def upgrade_measurements():     # Migrates Download/Upload from year, month, day and time strings to one timestamp column
+    for model in (Download, Upload):
+        table = model.__tablename__
+        legacy = table + '_legacy'
+        inspector = db.inspect(db.engine)
+        names = inspector.get_table_names()
+
+        # Rows left in <table>_legacy by an interrupted run are moved into the timestamp schema first
+        if legacy in names:
+            if table in names and 'timestamp' not in [c['name'] for c in inspector.get_columns(table)]:
+                click.echo('{} and {} both use the old schema, remove one of them'.format(table, legacy))
+                continue
+            with ddl_transaction() as conn:
+                for index in inspector.get_indexes(legacy):
+                    conn.execute(db.text('DROP INDEX {}'.format(index['name'])))
+                if table not in names:
+                    model.__table__.create(conn)
+                copied, skipped = copy_legacy(conn, model)
+            click.echo('{} recovered {} rows from {}, skipped {} duplicates'.format(table, copied, legacy, skipped))
+            continue
+
+        if table not in names:
+            continue
+        if 'timestamp' in [c['name'] for c in inspector.get_columns(table)]:
+            click.echo('{} is up to date'.format(table))
+            continue
+
+        # The rename, copy and drop commit together, a failure leaves the table as it was
+        with ddl_transaction() as conn:
+            # Old per-column indexes are dropped so the new table can reuse their names
+            for index in inspector.get_indexes(table):
+                conn.execute(db.text('DROP INDEX {}'.format(index['name'])))
+            conn.execute(db.text('ALTER TABLE {0} RENAME TO {1}'.format(table, legacy)))
+            model.__table__.create(conn)
+            copied, skipped = copy_legacy(conn, model)
+        click.echo('{} migrated to the timestamp schema, skipped {} duplicate rows'.format(table, skipped))
+
+@bp.cli.command('rebuild-rollups')
+def rebuild_rollups():          # Recomputes the hourly and daily rollup tables from the raw measurements
+    days = rollups.rebuild()
+    click.echo('Rebuilt rollups for {} direction-days'.format(days))
+
+@bp.cli.command('rebuild-catalog')
+def rebuild_catalog():          # Recounts the available-dates catalog from the raw measurements
+    days = catalog.rebuild()
+    click.echo('Catalogued {} dates'.format(days))
+
+@bp.cli.command('rebuild-forum')
+def rebuild_forum():            # Gives forum topics their slugs and recounts their posts
+    topics = forum.rebuild()
+    click.echo('Rebuilt {} forum topics'.format(topics))
+
+@bp.cli.command('rebuild-search')
+def rebuild_search():           # Creates the forum search index and refills it from the forum tables
+    rows = search.rebuild()
+    if rows is None:
+        click.echo('Full-text search needs SQLite with FTS5, the forum is searched with LIKE')
+    else:
+        click.echo('Indexed {} forum topics and posts'.format(rows))
+
+@bp.cli.command('ingest')
+@click.option('--loop', is_flag=True, help='Keep syncing every --interval seconds.')
+@click.option('--interval', default=360, show_default=True, help='Seconds between the start of consecutive syncs.')
+@click.option('--wait', is_flag=True, help='Queue behind a running sync instead of skipping.')
+@click.option('--metrics-port', type=int, help='Serve Prometheus metrics of this worker on the port.')
+def ingest(loop, interval, wait, metrics_port):     # Syncs NDT7 data from Dropbox outside the web process
+    from app import worker
+    if metrics_port:
+        metrics.serve(metrics_port)
+    while True:
+        started = time.monotonic()
+        try:
+            if worker.run_ingest(wait=wait):
+                click.echo('NDT7 sync finished in {:.1f}s'.format(time.monotonic() - started))
+            else:
+                click.echo('NDT7 sync skipped, another process is syncing')
+        except Exception:
+            if not loop:            # A single run reports its failure through the exit status
+                raise
+            # A network or database error fails this run only, the worker retries at the next interval
+            current_app.logger.exception('NDT7 sync failed, retrying in %ds', interval)
+            click.echo('NDT7 sync failed after {:.1f}s, see the log'.format(time.monotonic() - started))
+            db.session.rollback()
+        if not loop:
+            break
+        time.sleep(max(0, interval - (time.monotonic() - started)))   # A slow run delays the next one instead of overlapping it
+
+def local_source(path, processes):      # Directory or tar archive source of a command's PATH argument
+    from app import sources
+    try:
+        return sources.local_source(path, processes)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+def locked(wait, func, *args, **kwargs):   # Runs 'func' on the write engine under the ingest lock shared with the Dropbox sync
+    from app import worker
+    try:
+        with worker.ingest_lock(current_app.config['INGEST_LOCK_FILE'], wait=wait), db.use_writer():
+            return func(*args, **kwargs)
+    except worker.LockHeld:
+        raise click.ClickException('Another process is syncing, rerun with --wait to queue behind it')
+
+def report(stored, failed):
+    click.echo('Stored {} NDT7 files, {} failed'.format(stored, failed))
+    click.echo('Journal: ' + ', '.join('{} {}'.format(n, state) for state, n in sorted(journal.counts().items())))
+
+@bp.cli.command('ingest-local')
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--processes', type=int, help='Parse processes, defaults to INGEST_PARSE_PROCESSES.')
+@click.option('--wait', is_flag=True, help='Queue behind a running sync instead of exiting.')
+def ingest_local(path, processes, wait):     # Ingests a local ndt7 datadir or tar archive of it without Dropbox
+    from app import database
+    report(*locked(wait, database.sync, local_source(path, processes)))
+
+@bp.cli.command('backfill')
+@click.option('--from', 'start', required=True, type=click.DateTime(formats=['%Y-%m-%d']), help='First UTC date to ingest.')
+@click.option('--to', 'end', required=True, type=click.DateTime(formats=['%Y-%m-%d']), help='Last UTC date to ingest.')
+@click.option('--source', type=click.Path(exists=True), help='Local ndt7 datadir or tar archive instead of Dropbox.')
+@click.option('--processes', type=int, help='Parse processes of a local --source.')
+@click.option('--retry-quarantined', is_flag=True, help='Also retry quarantined files of the dates.')
+@click.option('--wait', is_flag=True, help='Queue behind a running sync instead of exiting.')
+def backfill(start, end, source, processes, retry_quarantined, wait):     # Ingests the NDT7 files of a date range, resuming from the ingestion journal
+    from app import database, sources
+    if end < start:
+        raise click.BadParameter('--to must not be before --from')
+    source = local_source(source, processes) if source else sources.DropboxSource()
+    report(*locked(wait, database.backfill, source, start.date(), end.date(), quarantined=retry_quarantined))
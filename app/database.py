@@ -1,137 +1,157 @@
 # Database and Database models
-from app import app, db
-from app.models import Download, Upload
+from app import db
+from flask import current_app
+from app.models import Upload, SyncState, TestSeries
+
+# NDT7 file sources and data version bookkeeping
+from app import rollups, catalog, journal, metrics
+from app.sources import CURSOR_KEY, DropboxSource
+from app.queries import DIRECTIONS, LAST_INGEST_KEY, LAST_INGEST_FORMAT
 
 # Helper libraries
-import pathlib
-import pandas as pd
-import dropbox
-import gzip
-import os
-import json
-
-def dropbox_storage():      # Callable from routes.py - Filters and stores NDT7 data from dropbox into a database 
-    # Dropbox authentication
-    dbx = dropbox.Dropbox(
-                app_key = app.config['APP_KEY'],
-                app_secret = app.config['APP_SECRET'],
-                oauth2_refresh_token = app.config['OAUTH2_REFRESH_TOKEN']
-            )
-
-    path = '/ndt-server/datadir/ndt7'       # Path to NDT7 files
-    upload = []                             # Stores NDT7 upload filenames
-    download = []                           # Stores NDT7 download filenames
-
-    # Extracts NDT7 upload and download filenames from all subdirectories in 'path'
-    for year in dbx.files_list_folder(path).entries:
-        for month in dbx.files_list_folder(path + '/' + year.name).entries:
-            for day in dbx.files_list_folder(path + '/' + year.name + '/' + month.name ).entries:
-                for filename in dbx.files_list_folder(path + '/' + year.name + '/' + month.name + '/' + day.name).entries:
-                    if 'upload' in filename.name:
-                        upload.append(filename.name)
-                    else:
-                        download.append(filename.name)
-
-    def db_storage(metric):             # 'metric' points to a database entity
-        if metric == 'upload':          # NDT7 upload data
-            metric = upload             # Upload filenames
-            db_attr = Upload            # Upload db entity
-        elif metric == 'download':      # NDT7 download data
-            metric = download           # Download filenames
-            db_attr = Download          # Download db entity
-
-        for fn in metric:               # Checks existing filename in the db entity
-            if db_attr.query.filter_by(filename=fn).first() != None:
-                continue
-            
-            dropbox_dir = '/ndt-server/datadir/ndt7/'       # Same as 'path'
-
-            index = fn.find('-', fn.find('-') + 1)
-            year = fn[index + 1: index + 5]                 # Extract the year from the filename  
-            month = fn[index + 5 : index + 7]               # Extract the month from the filename
-            day = fn[index + 7 : index + 9]                 # Extract the day from the filename
-
-            with open('tmp.gz', 'wb') as f:         # Retrieve NDT7 JSON.GZIP data from dropbox and write as a temporary GZIP 
-                metadata, result = dbx.files_download(path='{}/{}/{}/{}/{}'.format(path, year, month, day, fn))
-                f.write(result.content)
-                f.close() 
-
-            with gzip.open('tmp.gz', "rb") as f:    # Unzip temporary GZIP as a JSON into 'd'
-                d = json.loads(f.read().decode("ascii"))
-                f.close()
-            os.unlink("tmp.gz")             # Removes temporary GZIP
-
-            df = pd.DataFrame(d.items())    # Converts JSON in 'd' into a dataframe
-            
-            start_time = (df[1].iloc[8]['StartTime'])   # Retrieve start time of NDT7 test from 'df'
-            year = start_time[0:4]                      # Retrieve year of NDT7 test
-            month = start_time[5:7]                     # Retrieve month of NDT7 test
-            day = start_time[8:10]                      # Retrieve day of NDT7 test
-            time = start_time[11:19]                    # Retrieve time in UTC of NDT7 test
-
-            server_data = (df[1].iloc[8]['ServerMeasurements']) # Retrieve measurement data from 'df'
-            
-            if server_data == None:     # Checks if test was dropped
-                client_ip = ''
-                server_ip = ''
-                busy_time = float("nan")
-                bytes_acked = float("nan")
-                bytes_received = float("nan")
-                bytes_sent = float("nan")
-                bytes_retrans = float("nan")
-                elapsed_time = float("nan")
-                min_rtt = float("nan")
-                rtt = float("nan")
-                rtt_var = float("nan")
-                rwnd_limited = float("nan")
-                snd_buf_limited = float("nan")
-
-            else:
-                server_measurements = (server_data[-1])     # Last recorded measurement
-
-                connection_info = server_measurements['ConnectionInfo']
-                client_ip = connection_info['Client']       # Client IP address
-                server_ip = connection_info['Server']       # Server IP address
-
-                # NDT7 metadata - https://github.com/m-lab/ndt-server/blob/main/spec/ndt7-protocol.md
-                tcp_info = server_measurements['TCPInfo']
-                busy_time = tcp_info['BusyTime']
-                bytes_acked = tcp_info['BytesAcked']
-                bytes_received = tcp_info['BytesReceived']
-                bytes_sent = tcp_info['BytesSent']
-                bytes_retrans = tcp_info['BytesRetrans']
-                elapsed_time = tcp_info['ElapsedTime']
-                min_rtt = tcp_info['MinRTT']
-                rtt = tcp_info['RTT']
-                rtt_var = tcp_info['RTTVar']
-                rwnd_limited = tcp_info['RWndLimited']
-                snd_buf_limited = tcp_info['SndBufLimited']
-
-            u = db_attr(                        # Write data to a temporary instance of the db entity
-                    year = year,
-                    month = month,
-                    day = day, 
-                    filename = fn,
-                    time = time,
-                    client_ip = client_ip,
-                    server_ip = server_ip,
-                    busy_time = busy_time,
-                    bytes_acked = bytes_acked,
-                    bytes_received = bytes_received,
-                    bytes_sent = bytes_sent,
-                    bytes_retrans = bytes_retrans,
-                    elapsed_time = elapsed_time,
-                    min_rtt = min_rtt,
-                    rtt = rtt,
-                    rtt_var = rtt_var,
-                    rwnd_limited = rwnd_limited,
-                    snd_buf_limited = snd_buf_limited
-                )
-
-            # Add entries to the database and commit the changes.
-            db.session.add(u)
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+
+def set_state(key, value):          # Stores a SyncState value in the current transaction
+    state = SyncState.query.get(key)
+    if state is None:
+        state = SyncState(key=key)
+        db.session.add(state)
+    state.value = value
+
+def known_filenames(db_attr, filenames):    # Set of 'filenames' already stored in the db entity
+    known = set()
+    filenames = list(filenames)
+    for i in range(0, len(filenames), 500):     # Chunked to stay below SQLite's bound parameter limit
+        chunk = filenames[i:i + 500]
+        known.update(fn for (fn,) in db_attr.query.with_entities(db_attr.filename).filter(db_attr.filename.in_(chunk)))
+    return known
+
+def insert_batch(db_attr, direction, rows, tests, source, paths):     # Inserts rows and their series and journals them stored in one transaction
+    db.session.bulk_insert_mappings(db_attr, rows)
+    db.session.bulk_insert_mappings(TestSeries, tests)
+    journal.mark_stored(source, paths)
+    catalog.add_tests(direction, rows)     # Counts the tests and invalidates cached plots of the affected dates
+    rollups.refresh(direction, rows)
+    set_state(LAST_INGEST_KEY, datetime.utcnow().strftime(LAST_INGEST_FORMAT))
+    db.session.commit()
+
+def store_batch(db_attr, rows, source, paths, failures):    # Stores a batch of rows, returns how many were inserted
+    if not rows:
+        return 0
+    direction = 'upload' if db_attr is Upload else 'download'
+
+    # Packed sample series go to their own table, dropped tests have none
+    tests = []
+    for row in rows:
+        packed = row.pop('series', None)
+        if packed is not None:
+            tests.append({'filename': row['filename'], 'direction': direction, 'samples': packed[0], 'data': packed[1]})
+
+    with metrics.INSERT_SECONDS.time(direction=direction):
+        try:
+            insert_batch(db_attr, direction, rows, tests, source, paths)
+        except IntegrityError as e:
+            # Another run stored some of the files since they were listed - those are marked stored and the rest inserted again
+            db.session.rollback()
+            filenames = [row['filename'] for row in rows]
+            known = known_filenames(db_attr, filenames) | known_filenames(TestSeries, filenames)
+            current_app.logger.warning('%d of %d %s rows were already stored: %r', len(known), len(rows), direction, e.orig)
+            journal.mark_stored(source, [path for path, row in zip(paths, rows) if row['filename'] in known])
             db.session.commit()
-
-    # Function Calls
-    db_storage('download')
-    db_storage('upload')
\ No newline at end of file
+            paths = [path for path, row in zip(paths, rows) if row['filename'] not in known]
+            rows = [row for row in rows if row['filename'] not in known]
+            tests = [test for test in tests if test['filename'] not in known]
+            if not rows:
+                return 0
+            try:
+                insert_batch(db_attr, direction, rows, tests, source, paths)
+            except IntegrityError as e:     # Not a duplicate - the files are retried by later runs until they are quarantined
+                db.session.rollback()
+                current_app.logger.error('Failed to store %d %s rows: %r', len(rows), direction, e.orig)
+                failures.extend((path, 'store', e.orig) for path in paths)
+                return 0
+    catalog.invalidate()
+    metrics.FILES_STORED.inc(len(rows), direction=direction)
+    newest = max(row['timestamp'] for row in rows)
+    metrics.NEWEST_TEST.set_max((newest - datetime(1970, 1, 1)).total_seconds(), direction=direction)
+    return len(rows)
+
+def ingest(source, entries):        # Fetches and stores journaled files of 'source', recording failures back in the journal
+    failures = []                   # (source path, stage, error) of files that could not be ingested
+    stored = 0
+    for direction, (db_attr, _) in DIRECTIONS.items():
+        new = {e.path: e.filename for e in entries if e.direction == direction}    # Source path -> filename
+
+        # Files stored before they were journaled are only marked stored
+        known = known_filenames(db_attr, new.values())
+        if known:
+            journal.mark_stored(source.name, [p for p, fn in new.items() if fn in known])
+            db.session.commit()
+            new = {p: fn for p, fn in new.items() if fn not in known}
+
+        rows = []                   # Pending rows of the current batch
+        paths = []                  # Source paths of the pending rows
+        for file_path, row in source.fetch(new, failures):
+            row['filename'] = new[file_path]
+            rows.append(row)            # Queue data for the next batch insert into the db entity
+            paths.append(file_path)
+
+            if len(rows) >= current_app.config['INGEST_BATCH_SIZE']:
+                stored += store_batch(db_attr, rows, source.name, paths, failures)
+                rows, paths = [], []
+
+        stored += store_batch(db_attr, rows, source.name, paths, failures)  # Remaining partial batch
+
+    if failures:            # Failed files are retried by later runs until they are quarantined
+        by_path = {e.path: e for e in entries}
+        for file_path, stage, error in failures:
+            journal.mark_failed(by_path[file_path], stage, error)
+            metrics.FILES_FAILED.inc(stage=stage)
+        db.session.commit()
+        current_app.logger.error('%d NDT7 files could not be ingested', len(failures))
+    return stored, len(failures)
+
+def journal_new(source, files):     # Journals listed files - {path: filename} - whose measurements are not stored yet
+    known = set()
+    for db_attr, _ in DIRECTIONS.values():
+        known |= known_filenames(db_attr, files.values())
+    new = journal.add_listed(source.name, {p: fn for p, fn in files.items() if fn not in known})
+
+    kind = metrics.source_kind(source)
+    metrics.FILES_LISTED.inc(len(files), source=kind)
+    metrics.FILES_NEW.inc(new, source=kind)
+    metrics.FILES_SKIPPED.inc(len(files) - new, source=kind)
+    return new
+
+def sync(source):                   # Journals the new files of 'source' and ingests everything it has pending
+    with metrics.sync_run(source):
+        with metrics.LIST_SECONDS.time(source=metrics.source_kind(source)):
+            files, cursor = source.list_changes()
+        journal_new(source, files)
+        if cursor is not None:      # The cursor can advance once the listed files are journaled
+            set_state(CURSOR_KEY, cursor)
+        db.session.commit()
+
+        # Listed files of this run and files left over by interrupted or failed runs
+        return ingest(source, journal.pending(source.name))
+
+def dropbox_storage(dbx=None):      # Callable from worker.py - Filters and stores NDT7 data from dropbox into a database
+    return sync(DropboxSource(dbx))
+
+def backfill(source, start, end, quarantined=False):   # Journals and ingests every file of the dates [start, end]
+    with metrics.sync_run(source):
+        date = start
+        while date <= end:          # Dates already journaled are relisted cheaply, known files are skipped
+            with metrics.LIST_SECONDS.time(source=metrics.source_kind(source)):
+                files = source.list_day(date)
+            journal_new(source, files)
+            db.session.commit()
+            date += timedelta(days=1)
+
+        # Quarantined files are only retried when asked, their attempt count restarts
+        entries = journal.pending(source.name, start, end, quarantined=quarantined)
+        for e in entries:
+            if e.state == 'quarantined':
+                e.attempts = 0
+        return ingest(source, entries)
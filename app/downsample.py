@@ -0,0 +1,44 @@
+# Shape-preserving downsampling of plotted series so long date ranges stay within a fixed point budget
+# Largest-Triangle-Three-Buckets - https://skemman.is/bitstream/1946/15343/3/SS_MSthesis.pdf
+
+# Helper libraries
+import numpy as np
+
+def lttb(x, y, threshold):      # Indices of the 'threshold' points of (x, y) that best preserve its shape
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = x.astype(float)
+    every = (n - 2) / (threshold - 2)       # Points per bucket, the first and last points are always kept
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0] = a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        if end >= n - 1:                    # Last bucket points at the final point
+            next_x, next_y = x[n - 1], y[n - 1]
+        else:
+            next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+
+        # Keep the point forming the largest triangle with the previous kept point and the next bucket's average
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    kept[-1] = n - 1
+    return kept
+
+def downsample_columns(x, columns, threshold):     # x and {name: y} reduced to at most 'threshold' rows that share x
+    if len(x) <= threshold:
+        return x, columns
+    x_values = x.astype(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x
+
+    # Each column keeps its own share of the budget, the union of kept rows preserves the shape of all of them
+    share = max(3, threshold // len(columns))
+    kept = []
+    for y in columns.values():
+        finite = np.flatnonzero(np.isfinite(y))     # Dropped tests (NaN) are skipped
+        kept.append(finite[lttb(x_values[finite], y[finite], share)])
+    kept = np.unique(np.concatenate(kept))
+    return x[kept], {name: y[kept] for name, y in columns.items()}
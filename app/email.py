@@ -1,29 +1,191 @@
+# Outbound email - requests only render and queue a message, one background thread per process delivers it
+# through the configured transport, retries transient failures with backoff and writes undeliverable messages to a dead-letter file
 # Flask imports
-from app import app
-from flask import render_template
-
-# SendGrid API
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-
-def send_email(subject, sender, recipients, body):      # SendGrid API - Create and Send email
-    message = Mail(
-        from_email=sender,          # Sender
-        to_emails=recipients,       # Receiver
-        subject=subject,            # Subject
-        html_content=body           # Body
-    )
-    sg = SendGridAPIClient(app.config['MAIL_PASSWORD'])     # SendGrid API Authenticator
-    response = sg.send(message)                             # Send Email
+from flask import current_app, render_template
+from werkzeug.utils import import_string
+
+# Helper libraries
+import atexit
+import heapq
+import itertools
+import json
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+
+class MailError(Exception):     # Failed delivery - 'retry' is False when sending the message again cannot succeed
+    def __init__(self, reason, retry=True, after=None):
+        Exception.__init__(self, reason)
+        self.retry = retry
+        self.after = after          # Seconds the provider asked to wait before the next attempt
+
+class SendGridTransport(object):    # SendGrid v3 API through one HTTP session, so connections are reused between messages
+    URL = 'https://api.sendgrid.com/v3/mail/send'
+
+    def __init__(self, config):
+        self.api_key = config['MAIL_PASSWORD']      # SendGrid API Authenticator
+        self.timeout = config['MAIL_TIMEOUT']
+        self.session = None
+
+    def send(self, message):
+        # SendGrid and requests, loaded with the first email
+        import requests
+        from sendgrid.helpers.mail import Mail
+
+        if self.session is None:
+            self.session = requests.Session()
+            self.session.headers['Authorization'] = 'Bearer ' + self.api_key
+        mail = Mail(
+            from_email=message['sender'],           # Sender
+            to_emails=message['recipients'],        # Receiver
+            subject=message['subject'],             # Subject
+            html_content=message['body']            # Body
+        )
+        try:
+            response = self.session.post(self.URL, json=mail.get(), timeout=self.timeout)
+        except requests.RequestException as e:
+            raise MailError(repr(e))
+        if response.status_code == 429 or response.status_code >= 500:
+            after = response.headers.get('Retry-After')
+            raise MailError('SendGrid {}: {}'.format(response.status_code, response.text[:200]),
+                            after=float(after) if after and after.isdigit() else None)
+        if response.status_code >= 400:     # Rejected message or credentials
+            raise MailError('SendGrid {}: {}'.format(response.status_code, response.text[:200]), retry=False)
+
+class CaptureTransport(object):     # Keeps messages in 'outbox' and, with MAIL_CAPTURE_DIR, writes each one to a JSON file - for tests and offline deployments
+    def __init__(self, config):
+        self.directory = config['MAIL_CAPTURE_DIR']
+        self.outbox = []
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        with self.lock:
+            self.outbox.append(message)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            name = '{:%Y%m%dT%H%M%S%f}-{}.json'.format(datetime.utcnow(), message['id'])
+            with open(os.path.join(self.directory, name), 'w') as f:
+                json.dump(message, f, indent=2)
+
+# MAIL_TRANSPORT name -> transport class, other values are imported as 'package.module:Class'
+TRANSPORTS = {
+    'sendgrid': SendGridTransport,
+    'capture': CaptureTransport
+}
+
+class MailQueue(object):
+    def __init__(self):
+        self.app = None
+        self.transport = None
+        self.queue = queue.Queue()          # Messages waiting for their first attempt
+        self.retries = []                   # Heap of (due monotonic time, sequence, message) waiting for another attempt
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.busy = 0                       # Messages taken from the queue and not yet delivered or given up on
+        self.thread = None
+
+    def init_app(self, app):        # Creates the MAIL_TRANSPORT transport, messages are delivered with the MAIL_* settings of this app
+        self.app = app
+        name = app.config['MAIL_TRANSPORT']
+        self.transport = (TRANSPORTS.get(name) or import_string(name))(app.config)
+
+    def send(self, subject, sender, recipients, body):     # Queues a message and returns at once, the delivery thread starts with the first one
+        message = {'id': next(self.ids), 'subject': subject, 'sender': sender, 'recipients': list(recipients),
+                   'body': body, 'queued': datetime.utcnow().isoformat(), 'attempts': 0}
+        with self.lock:
+            self.busy += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='mail', daemon=True)
+                self.thread.start()
+        self.queue.put(message)
+        return message['id']
+
+    def pending(self):              # Messages not yet delivered or given up on
+        with self.lock:
+            return self.busy
+
+    def deliver(self, message):
+        config = self.app.config
+        message['attempts'] += 1
+        try:
+            self.transport.send(message)
+        except Exception as e:
+            retry = getattr(e, 'retry', True)
+            if not retry or message['attempts'] >= config['MAIL_MAX_ATTEMPTS']:
+                self.dead_letter(message, e)
+                return
+            # Full jitter - wait a random time up to the exponential backoff ceiling
+            delay = random.uniform(0, min(config['MAIL_BACKOFF_MAX'], config['MAIL_BACKOFF_BASE'] * 2 ** message['attempts']))
+            delay = max(delay, getattr(e, 'after', None) or 0)     # Never retry sooner than the provider asks
+            self.app.logger.warning('Retrying email %d in %.1fs after %r', message['id'], delay, e)
+            with self.lock:
+                heapq.heappush(self.retries, (time.monotonic() + delay, message['id'], message))
+            return
+        with self.lock:
+            self.busy -= 1
+
+    def dead_letter(self, message, error):      # Appends an undeliverable message to MAIL_DEAD_LETTER_FILE
+        self.app.logger.error('Email %d to %s failed after %d attempts: %r', message['id'], ', '.join(message['recipients']), message['attempts'], error)
+        path = self.app.config['MAIL_DEAD_LETTER_FILE']
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'a') as f:
+                f.write(json.dumps(dict(message, error=repr(error), failed=datetime.utcnow().isoformat())) + '\n')
+        except OSError:
+            self.app.logger.exception('Failed to write email %d to the dead-letter file', message['id'])
+        with self.lock:
+            self.busy -= 1
+
+    def due(self):                  # Next retry whose time has come, or None
+        with self.lock:
+            if self.retries and self.retries[0][0] <= time.monotonic():
+                return heapq.heappop(self.retries)[2]
+
+    def wait(self):                 # Seconds until the next retry, None when there is none
+        with self.lock:
+            return max(0, self.retries[0][0] - time.monotonic()) if self.retries else None
+
+    def run(self):
+        while True:
+            try:
+                message = self.queue.get(timeout=self.wait())
+            except queue.Empty:
+                message = None
+            if message is not None:
+                self.deliver(message)
+            message = self.due()
+            while message is not None:
+                self.deliver(message)
+                message = self.due()
+
+    def close(self, timeout=None):  # Waits for pending messages, then writes the ones still waiting for a retry to the dead-letter file
+        if self.app is None:
+            return
+        deadline = time.monotonic() + (self.app.config['MAIL_SHUTDOWN_SECONDS'] if timeout is None else timeout)
+        while self.pending() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        with self.lock:
+            waiting, self.retries = self.retries, []
+        for _, _, message in waiting:
+            self.dead_letter(message, MailError('Not delivered before shutdown'))
+
+mail = MailQueue()              # Configured by create_app()
+atexit.register(mail.close)     # Queued messages get MAIL_SHUTDOWN_SECONDS to go out on a clean shutdown
+
+def send_email(subject, sender, recipients, body):      # Queues an email for the background delivery thread
+    return mail.send(subject, sender, recipients, body)
 
 def send_password_reset_email(user):                            # Create and Email a Password Reset Token to a logged-in user
     token = user.get_reset_password_token()                     # Create a token for the logged-in user
     send_email('[MIRC Data Dashboard] Reset Your Password',     # Email the token
-               sender=app.config['MAIL_DEFAULT_SENDER'],        # Sender
+               sender=current_app.config['MAIL_DEFAULT_SENDER'],        # Sender
                recipients=[user.email],                         # Receiver
                body=render_template(
                    'email/reset_password.html',                 # HTML template
                    user=user,                                   # Logged-in user
                    token=token                                  # Create token
                 )
-            )
\ No newline at end of file
+            )
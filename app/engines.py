@@ -0,0 +1,113 @@
+# Database engines - SQLite tuning, connection pools and a read-only engine for queries outside write transactions
+# Sessions send plain SELECTs to the read engine until they write, then stay on the write engine until commit or rollback
+# so web requests keep reading while the ingestion worker holds a write transaction
+# Ingestion runs inside db.use_writer(), its reads decide what to write and must see the committed state of the writer
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, _EngineConnector, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.sql.selectable import Select, CompoundSelect, TextualSelect
+
+# Helper libraries
+from contextlib import contextmanager
+
+READ_BIND = '__read__'      # Bind key of the read-only engine
+
+def is_memory(uri):         # In-memory SQLite databases exist once per connection and cannot be shared by two engines
+    return uri.startswith('sqlite') and (uri.rstrip('/') == 'sqlite:' or ':memory:' in uri)
+
+def tune_sqlite(config):    # Connect listener applying the SQLITE_* settings to each new SQLite connection
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA busy_timeout = {:d}'.format(config['SQLITE_BUSY_TIMEOUT']))
+        cursor.execute('PRAGMA journal_mode = {}'.format(config['SQLITE_JOURNAL_MODE']))
+        cursor.execute('PRAGMA synchronous = {}'.format(config['SQLITE_SYNCHRONOUS']))
+        cursor.execute('PRAGMA cache_size = {:d}'.format(config['SQLITE_CACHE_SIZE']))
+        cursor.execute('PRAGMA mmap_size = {:d}'.format(config['SQLITE_MMAP_SIZE']))
+        cursor.close()
+    return connect
+
+def query_only(dbapi_connection, connection_record):    # Connections of the SQLite read engine reject writes
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA query_only = 1')
+    cursor.close()
+
+class ReadConnector(_EngineConnector):      # Read engine - DATABASE_READ_URL, a replica for example, or the main database
+    def get_uri(self):
+        return self._app.config['DATABASE_READ_URL'] or self._app.config['SQLALCHEMY_DATABASE_URI']
+
+    def get_engine(self):
+        engine = _EngineConnector.get_engine(self)
+        if engine.dialect.name == 'sqlite' and not event.contains(engine, 'connect', query_only):
+            event.listen(engine, 'connect', query_only)
+        return engine
+
+def is_read(clause):         # SELECTs, including textual ones such as the forum search, may use the read engine
+    if isinstance(clause, (Select, CompoundSelect, TextualSelect)):
+        return getattr(clause, '_for_update_arg', None) is None     # SELECT ... FOR UPDATE locks rows on the writer
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip().upper().startswith('SELECT')
+    return False
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None, **kw):
+        read = is_read(clause)
+        if read and not self.info.get('writing') and not self.info.get('writer'):
+            reader = get_state(self.app).db.get_reader(self.app)
+            if reader is not None:
+                return reader
+        if not read and (clause is not None or mapper is not None):    # DML, DDL and flushes - reads after a write see its uncommitted rows
+            self.info['writing'] = True
+        return SignallingSession.get_bind(self, mapper, clause)
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def end_writing(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('writing', None)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def make_connector(self, app=None, bind=None):
+        if bind == READ_BIND:
+            return ReadConnector(self, self.get_app(app), None)
+        return SQLAlchemy.make_connector(self, app, bind)
+
+    @contextmanager
+    def use_writer(self):               # Sends every statement of the current session to the write engine, across commits
+        session = self.session()
+        pinned = session.info.get('writer')
+        session.info['writer'] = True
+        try:
+            yield
+        finally:
+            if not pinned:
+                session.info.pop('writer', None)
+
+    def get_reader(self, app=None):     # Read-only engine, None when reads share the write engine
+        app = self.get_app(app)
+        uri = app.config['DATABASE_READ_URL'] or app.config['SQLALCHEMY_DATABASE_URI']
+        if not app.config['DATABASE_READ_ROUTING'] or is_memory(uri):
+            return None
+        return self.get_engine(app, bind=READ_BIND)
+
+    def apply_driver_hacks(self, app, sa_url, options):    # Connection pools - Flask-SQLAlchemy opens a connection per session for SQLite otherwise
+        if sa_url.drivername.startswith('sqlite'):
+            if sa_url.database not in (None, '', ':memory:'):
+                options.setdefault('poolclass', QueuePool)
+                options.setdefault('pool_size', app.config['DATABASE_POOL_SIZE'])
+                options.setdefault('max_overflow', app.config['DATABASE_MAX_OVERFLOW'])
+                options.setdefault('connect_args', {})['check_same_thread'] = False     # Pooled connections move between threads
+        else:
+            options.setdefault('pool_size', app.config['DATABASE_POOL_SIZE'])
+            options.setdefault('max_overflow', app.config['DATABASE_MAX_OVERFLOW'])
+            options.setdefault('pool_recycle', app.config['DATABASE_POOL_RECYCLE'])
+            options.setdefault('pool_pre_ping', True)
+        return SQLAlchemy.apply_driver_hacks(self, app, sa_url, options)
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = SQLAlchemy.create_engine(self, sa_url, engine_opts)
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', tune_sqlite(self.get_app().config))
+        return engine
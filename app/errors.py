@@ -1,12 +1,14 @@
 # Flask and Database Imports
-from app import app, db
-from flask import render_template
+from app import db
+from flask import Blueprint, render_template
 
-@app.errorhandler(404)          # Error 404 webpage
+bp = Blueprint('errors', __name__)
+
+@bp.app_errorhandler(404)          # Error 404 webpage
 def not_found_error(error):
     return render_template('404.html'), 404
 
-@app.errorhandler(500)          # Error 500 webpage
+@bp.app_errorhandler(500)          # Error 500 webpage
 def internal_error(error):
     db.session.rollback()
     return render_template('500.html'), 500
\ No newline at end of file
@@ -0,0 +1,133 @@
+# Forum threads and posts - keyset pagination, topic slugs and per-topic post counts
+# Pages start from a cursor on the (timestamp, id) indexes instead of counting and skipping the earlier rows,
+# so the last page of a long thread costs the same as the first
+from app import db
+from app.models import Topic, Post
+
+# Helper libraries
+import re
+import unicodedata
+from datetime import datetime
+
+CURSOR_FORMAT = '%Y%m%d%H%M%S%f'    # Timestamp part of a cursor
+SLUG_LENGTH = 80                    # Longest slug before a de-duplication suffix
+
+class Page(object):     # One page of rows in ascending (timestamp, id) order
+    def __init__(self, items, has_prev, has_next, first=None, total=None):
+        self.items = items
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.first = first          # 1-based position of the first row, None when unknown
+        self.total = total          # Rows on all pages, None when unknown
+
+    @property
+    def last(self):                 # 1-based position of the last row
+        if self.first is None or not self.items:
+            return None
+        return self.first + len(self.items) - 1
+
+    @property
+    def next_cursor(self):
+        return cursor(self.items[-1], self.last) if self.has_next and self.items else None
+
+    @property
+    def prev_cursor(self):
+        return cursor(self.items[0], self.first) if self.has_prev and self.items else None
+
+def cursor(row, position=None):     # 'timestamp.id' of a row, '.position' is added when known
+    parts = [row.timestamp.strftime(CURSOR_FORMAT), str(row.id)]
+    if position is not None:
+        parts.append(str(position))
+    return '.'.join(parts)
+
+def starting_at(row):               # Cursor of the page that starts with 'row'
+    return '{}.{}'.format(row.timestamp.strftime(CURSOR_FORMAT), row.id - 1)
+
+def parse_cursor(value):            # (timestamp, id, position or None) of a cursor, ValueError when malformed
+    parts = value.split('.')
+    if len(parts) not in (2, 3):
+        raise ValueError('Invalid cursor {!r}'.format(value))
+    position = int(parts[2]) if len(parts) == 3 else None
+    if position is not None and position < 0:
+        raise ValueError('Invalid cursor position {!r}'.format(value))
+    return datetime.strptime(parts[0], CURSOR_FORMAT), int(parts[1]), position
+
+def checked(items, has_prev, has_next, first, total):     # Page whose positions agree with its neighbours - stale counts and edited cursors are dropped
+    if not has_prev:
+        first = 1
+    elif first is not None and first < 2:       # Rows before the page leave no room for it
+        first = None
+    last = first + len(items) - 1 if first is not None else len(items)     # Position, or least position, of the last row
+    if not has_next and first is not None:
+        total = last
+    elif total is not None and (total < last or (has_next and total == last)):
+        total = None
+    return Page(items, has_prev, has_next, first, total)
+
+def paginate(query, model, per_page, after=None, before=None, last=False, total=None):     # Page of 'query' after or before a cursor, or its first or last page
+    key = db.tuple_(model.timestamp, model.id)
+    if before or last:
+        # Rows before the cursor are read backwards from it
+        position = None
+        if before:
+            timestamp, id, position = parse_cursor(before)
+            query = query.filter(key < db.tuple_(timestamp, id))
+        rows = query.order_by(model.timestamp.desc(), model.id.desc()).limit(per_page + 1).all()
+        items = rows[:per_page][::-1]
+        if before:
+            first = position - len(items) if position is not None else None
+        else:
+            first = total - len(items) + 1 if total is not None else None
+        return checked(items, len(rows) > per_page, bool(before), first, total)
+
+    position = 0
+    if after:
+        timestamp, id, position = parse_cursor(after)
+        query = query.filter(key > db.tuple_(timestamp, id))
+    rows = query.order_by(model.timestamp.asc(), model.id.asc()).limit(per_page + 1).all()
+    first = position + 1 if position is not None else None
+    return checked(rows[:per_page], bool(after), len(rows) > per_page, first, total)
+
+def slugify(title):     # URL name of a topic title, never only digits so it cannot be taken for a topic id
+    ascii = unicodedata.normalize('NFKD', title).encode('ascii', 'ignore').decode('ascii')
+    slug = re.sub(r'[^a-z0-9]+', '-', ascii.lower()).strip('-')[:SLUG_LENGTH].strip('-')
+    if not slug or slug.isdigit():
+        slug = '-'.join(filter(None, ['thread', slug]))
+    return slug
+
+def unique_slug(title):     # Slug of a title not used by another topic
+    base = slugify(title)
+    slug, n = base, 1
+    while Topic.query.filter_by(slug=slug).first() is not None:
+        n += 1
+        slug = '{}-{}'.format(base, n)
+    return slug
+
+def create_topic(title, author):
+    topic = Topic(title=title, slug=unique_slug(title), post_count=0, author=author)
+    db.session.add(topic)
+    db.session.commit()
+    return topic
+
+def add_post(topic, body, author):      # Stores a post and counts it on its topic in the same transaction
+    comment = Post(body=body, author=author, area=topic)
+    db.session.add(comment)
+    Topic.query.filter_by(id=topic.id).update({Topic.post_count: db.func.coalesce(Topic.post_count, 0) + 1}, synchronize_session=False)
+    db.session.commit()
+    return comment
+
+def find_topic(topic_id=None, slug=None):   # Topic of a URL's id or slug
+    if topic_id is not None:
+        return Topic.query.get(topic_id)
+    return Topic.query.filter_by(slug=slug).first()
+
+def rebuild():          # Gives topics without one a slug and recounts the posts of every topic
+    counts = dict(db.session.query(Post.topic_id, db.func.count()).group_by(Post.topic_id))
+    topics = Topic.query.order_by(Topic.id).all()
+    for topic in topics:
+        if not topic.slug:
+            topic.slug = unique_slug(topic.title or '')
+            db.session.flush()      # Later topics see the slug when choosing theirs
+        topic.post_count = counts.get(topic.id, 0)
+    db.session.commit()
+    return len(topics)
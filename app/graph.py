@@ -1,15 +1,13 @@
-# Flask app and db models imports
-from app import db
-from app.models import Download, Upload
-
-# Data Visualization library imports
-from bokeh.plotting import figure
-from bokeh.io import output_file, show, save
-from bokeh.models import HoverTool, DatetimeTickFormatter, FuncTickFormatter
+# Flask app, columnar measurement queries and render cache
+from flask import current_app, request
+from app.queries import DIRECTIONS, measurements, throughput as speed, day_version, range_version
+from app.cache import RenderCache
+from app.downsample import downsample_columns
+from app.series import throughput as test_throughput
 
 # Helper libraries
 import numpy as np
-from datetime import datetime as dt
+from datetime import datetime as dt, timedelta
 
 # Lookup table
 lkup = {
@@ -27,104 +25,52 @@ lkup = {
     "12": "December"
 }
 
-def throughput(year, month, day):   # Plots throughput vs timestamp
-    # dl_bytes - Sent bytes during download
-    # dl_elapsed - Elapsed time of download measurement
-    # dl_time - Start time in UTC of download
-    dl_bytes = Download.query.filter_by(year=year, month=month, day=day).with_entities(Download.bytes_acked).order_by(Download.year, Download.month, Download.day, Download.time).all()
-    dl_elapsed = Download.query.filter_by(year=year, month=month, day=day).with_entities(Download.elapsed_time).order_by(Download.year, Download.month, Download.day, Download.time).all()
-    dl_time = Download.query.filter_by(year=year, month=month, day=day).with_entities(Download.year, Download.month, Download.day, Download.time).order_by(Download.year, Download.month, Download.day, Download.time).all()
-
-    # up_bytes - Received bytes during upload
-    # up_elapsed - Elapsed time of upload measurement
-    # up_time - Start time in UTC of upload
-    up_bytes = Upload.query.filter_by(year=year, month=month, day=day).with_entities(Upload.bytes_received).order_by(Upload.year, Upload.month, Upload.day, Upload.time).all()
-    up_elapsed = Upload.query.filter_by(year=year, month=month, day=day).with_entities(Upload.elapsed_time).order_by(Upload.year, Upload.month, Upload.day, Upload.time).all()
-    up_time = Upload.query.filter_by(year=year, month=month, day=day).with_entities(Upload.year, Upload.month, Upload.day, Upload.time).order_by(Upload.year, Upload.month, Upload.day, Upload.time).all()
-
-    # Convert start times from string to DateTime object
-    dl_time = [dt.strptime('{}-{}-{} {}'.format(a[0], a[1], a[2], a[3]), "%Y-%m-%d %H:%M:%S") for a in dl_time]
-    up_time = [dt.strptime('{}-{}-{} {}'.format(a[0], a[1], a[2], a[3]), "%Y-%m-%d %H:%M:%S") for a in up_time]
-
-    # dl_speed - download throughput (Mbit/s) = sent bytes (dl_bytes) * 8 bits / Elapsed time in micro-seconds (dl_elapsed) 
-    # up_speed - upload throughput (Mbit/s) = received bytes (up_bytes) * 8 bits / Elapsed time in micro-seconds (up_elapsed)
-    # See https://github.com/m-lab/ndt-server/blob/main/spec/ndt7-protocol.md
-    dl_speed = [float('nan') if a[0] is None or b[0] is None else 8 * a[0]/b[0] for a,b in zip(dl_bytes, dl_elapsed)]
-    up_speed = [float('nan') if a[0] is None or b[0] is None else 8 * a[0]/b[0] for a,b in zip(up_bytes, up_elapsed)]
-
-    # Graph HTML output path
-    output_file("./app/static/throughput.html")
-
-    # Plot title
-    title = 'Average Throughput for {} {} {}'.format(lkup[month], day, year)
-
-    # Plot config
-    p = figure(x_axis_type="datetime", x_axis_label='Date (Year/Month/Day Hour:Min:Sec)', y_axis_label='Throughput (Mbit/s)', height=350, title=title)
-    p.title.text_font_size = '16pt'
-    p.xaxis.major_label_orientation = np.pi/4   # radians, "horizontal", "vertical", "normal"
-    p.sizing_mode = 'stretch_width'
-
-    # Download plot
-    p.line(x=dl_time, y=dl_speed, color='red', legend_label="Download (MBit/s)")
-    p.circle(x=dl_time, y=dl_speed, color='red', legend_label="Download (MBit/s)")
-
-    # Upload plot
-    p.line(x=up_time, y=up_speed, color='blue', legend_label="Upload (MBit/s)")
-    p.circle(x=up_time, y=up_speed, color='blue', legend_label="Upload (MBit/s)")
+# Rendered plots of each date, shared by all requests for that date - configured by create_app()
+render_cache = RenderCache()
 
-    # Plot tools
-    p.add_tools(HoverTool(tooltips=[("y", "@y"), ("x", "@x{%Y/%m/%d %H:%M:%S}")], formatters={'@x' : 'datetime'}))
-    p.xaxis[0].formatter=DatetimeTickFormatter(
-        years = ['%Y/%m/%d %H:%M:%S'],
-        months = ['%Y/%m/%d %H:%M:%S'],
-        days = ['%Y/%m/%d %H:%M:%S'],
-        hours = ['%Y/%m/%d %H:%M:%S'],
-        minutes = ['%Y/%m/%d %H:%M:%S'],
-        seconds = ['%Y/%m/%d %H:%M:%S']
-        )
-    save(p)     # Save graph to output path
+def day_range(year, month, day):    # [start, end) datetimes of a YYYY/MM/DD day
+    start = dt(int(year), int(month), int(day))
+    return start, start + timedelta(days=1)
 
-def min_round_trip(year, month, day):
-    # dl_min_rtt - Min roundtrip time during download
-    # dl_time - Start time in UTC of download
-    dl_min_rtt = Download.query.filter_by(year=year, month=month, day=day).with_entities(Download.min_rtt).order_by(Download.year, Download.month, Download.day, Download.time).all()
-    dl_time = Download.query.filter_by(year=year, month=month, day=day).with_entities(Download.year, Download.month, Download.day, Download.time).order_by(Download.year, Download.month, Download.day, Download.time).all()
+def range_measurements(start, end):     # Download and upload measurements in [start, end), fetched once per direction
+    return {direction: measurements(direction, start, end) for direction in DIRECTIONS}
 
-    # up_min_rtt - Min roundtrip time during upload
-    # up_time - Start time in UTC of upload
-    up_min_rtt = Upload.query.filter_by(year=year, month=month, day=day).with_entities(Upload.min_rtt).order_by(Upload.year, Upload.month, Upload.day, Upload.time).all()
-    up_time = Upload.query.filter_by(year=year, month=month, day=day).with_entities(Upload.year, Upload.month, Upload.day, Upload.time).order_by(Upload.year, Upload.month, Upload.day, Upload.time).all()
+def resources():        # BokehJS served by this app (see app/assets.py) instead of cdn.bokeh.org
+    from bokeh import __version__
+    from bokeh.resources import Resources
+    return Resources(mode='server', root_url='{}/bokeh/{}/'.format(request.script_root, __version__), components=['bokeh'])
 
-    # Convert start times from string to DateTime object
-    dl_time = [dt.strptime('{}-{}-{} {}'.format(a[0], a[1], a[2], a[3]), "%Y-%m-%d %H:%M:%S") for a in dl_time]
-    up_time = [dt.strptime('{}-{}-{} {}'.format(a[0], a[1], a[2], a[3]), "%Y-%m-%d %H:%M:%S") for a in up_time]
+def sources(data):      # One ColumnDataSource per direction shared by every plot, so each timestamp is sent once
+    from bokeh.models import ColumnDataSource
 
-    # Checks for NANs
-    dl_min_rtt = [float('nan') if a[0] is None else a[0] for a in dl_min_rtt]
-    up_min_rtt = [float('nan') if a[0] is None else a[0] for a in up_min_rtt]
+    shared = {}
+    for direction in DIRECTIONS:
+        # throughput - Mbit/s, see https://github.com/m-lab/ndt-server/blob/main/spec/ndt7-protocol.md
+        # rtt, min_rtt - Average and min roundtrip time during the test
+        columns = {'throughput': speed(data[direction]), 'rtt': data[direction]['rtt'], 'min_rtt': data[direction]['min_rtt']}
 
-    # Graph HTML output path
-    output_file("./app/static/min-round-trip.html")
+        # Long ranges are reduced to the plot's point budget
+        time, columns = downsample_columns(data[direction]['timestamp'], columns, current_app.config['PLOT_POINT_BUDGET'])
+        shared[direction] = ColumnDataSource(data=dict(columns, timestamp=time))
+    return shared
 
-    # Graph title
-    title = 'Minimum Round Trip Time for {} {} {}'.format(lkup[month], day, year)
+def time_plot(title, y_axis_label, column, source, legends):     # Download (red) and upload (blue) lines of one column vs timestamp
+    from bokeh.plotting import figure
+    from bokeh.models import HoverTool, DatetimeTickFormatter
 
     # Plot config
-    p = figure(x_axis_type="datetime", x_axis_label='Date (Year/Month/Day Hour:Min:Sec)', y_axis_label='Round Trip Time (ms)', height=350, title=title)
+    p = figure(x_axis_type="datetime", x_axis_label='Date (Year/Month/Day Hour:Min:Sec)', y_axis_label=y_axis_label, height=350, title=title)
     p.title.text_font_size = '16pt'
     p.xaxis.major_label_orientation = np.pi/4   # radians, "horizontal", "vertical", "normal"
     p.sizing_mode = 'stretch_width'
 
-    # Download plot for min roundtrip
-    p.line(x=dl_time, y=dl_min_rtt, color='red', legend_label="Download - Min RTT (ms)")
-    p.circle(x=dl_time, y=dl_min_rtt, color='red', legend_label="Download - Min RTT (ms)")
-
-    # Upload plot for min roundtrip
-    p.line(x=up_time, y=up_min_rtt, color='blue', legend_label="Upload - Min RTT (ms)")
-    p.circle(x=up_time, y=up_min_rtt, color='blue', legend_label="Upload - Min RTT (ms)")
+    # Download and upload plots
+    for direction, color in (('download', 'red'), ('upload', 'blue')):
+        p.line(x='timestamp', y=column, source=source[direction], color=color, legend_label=legends[direction])
+        p.circle(x='timestamp', y=column, source=source[direction], color=color, legend_label=legends[direction])
 
     # Plot tools
-    p.add_tools(HoverTool(tooltips=[("y", "@y"), ("x", "@x{%Y/%m/%d %H:%M:%S}")], formatters={'@x' : 'datetime'}))
+    p.add_tools(HoverTool(tooltips=[("y", "@" + column), ("x", "@timestamp{%Y/%m/%d %H:%M:%S}")], formatters={'@timestamp' : 'datetime'}))
     p.xaxis[0].formatter=DatetimeTickFormatter(
         years = ['%Y/%m/%d %H:%M:%S'],
         months = ['%Y/%m/%d %H:%M:%S'],
@@ -133,46 +79,21 @@ def min_round_trip(year, month, day):
         minutes = ['%Y/%m/%d %H:%M:%S'],
         seconds = ['%Y/%m/%d %H:%M:%S']
         )
-    save(p)     # Save graph to output path
-
-def avg_round_trip(year, month, day):
-    # dl_rtt - Average roundtrip time during download
-    # dl_time - Start time in UTC of download
-    dl_rtt = Download.query.filter_by(year=year, month=month, day=day).with_entities(Download.rtt).order_by(Download.year, Download.month, Download.day, Download.time).all()       
-    dl_time = Download.query.filter_by(year=year, month=month, day=day).with_entities(Download.year, Download.month, Download.day, Download.time).order_by(Download.year, Download.month, Download.day, Download.time).all()
-
-    # up_rtt - Average roundtrip time during upload
-    # up_time - Start time in UTC of upload
-    up_rtt = Upload.query.filter_by(year=year, month=month, day=day).with_entities(Upload.rtt).order_by(Upload.year, Upload.month, Upload.day, Upload.time).all()       
-    up_time = Upload.query.filter_by(year=year, month=month, day=day).with_entities(Upload.year, Upload.month, Upload.day, Upload.time).order_by(Upload.year, Upload.month, Upload.day, Upload.time).all()
+    return p
 
-    # Convert start times from string to DateTime object
-    dl_time = [dt.strptime('{}-{}-{} {}'.format(a[0], a[1], a[2], a[3]), "%Y-%m-%d %H:%M:%S") for a in dl_time]
-    up_time = [dt.strptime('{}-{}-{} {}'.format(a[0], a[1], a[2], a[3]), "%Y-%m-%d %H:%M:%S") for a in up_time]
+def throughput(label, source):      # Plots throughput vs timestamp
+    return time_plot('Average Throughput for {}'.format(label), 'Throughput (Mbit/s)', 'throughput', source,
+                     {'download': 'Download (MBit/s)', 'upload': 'Upload (MBit/s)'})
 
-    # Checks for NANs
-    dl_rtt = [float('nan') if a[0] is None else a[0] for a in dl_rtt]
-    up_rtt = [float('nan') if a[0] is None else a[0] for a in up_rtt]
+def min_round_trip(label, source):
+    return time_plot('Minimum Round Trip Time for {}'.format(label), 'Round Trip Time (ms)', 'min_rtt', source,
+                     {'download': 'Download - Min RTT (ms)', 'upload': 'Upload - Min RTT (ms)'})
 
-    # Graph HTML output path
-    output_file("./app/static/avg-round-trip.html")
+def avg_round_trip(label, source):
+    from bokeh.models import FuncTickFormatter
 
-    # Plot title
-    title = 'Average Round Trip Time for {} {} {}'.format(lkup[month], day, year)
-
-    # Plot config
-    p = figure(x_axis_type="datetime", x_axis_label='Date (Year/Month/Day Hour:Min:Sec)', y_axis_label='Round Trip Time (ms)', height=350, title=title)
-    p.title.text_font_size = '16pt'
-    p.xaxis.major_label_orientation = np.pi/4   # radians, "horizontal", "vertical", "normal"
-    p.sizing_mode = 'stretch_width'
-
-    # Download plot for average roundtrip
-    p.line(x=dl_time, y=dl_rtt, color='red', legend_label="Download - Smoothed RTT (ms)")
-    p.circle(x=dl_time, y=dl_rtt, color='red', legend_label="Download - Smoothed RTT (ms)")
-
-    # Upload plot for average roundtrip
-    p.line(x=up_time, y=up_rtt, color='blue', legend_label="Upload - Smoothed RTT (ms)")
-    p.circle(x=up_time, y=up_rtt, color='blue', legend_label="Upload - Smoothed RTT (ms)")
+    p = time_plot('Average Round Trip Time for {}'.format(label), 'Round Trip Time (ms)', 'rtt', source,
+                  {'download': 'Download - Smoothed RTT (ms)', 'upload': 'Upload - Smoothed RTT (ms)'})
 
     # Format y axis with prefixes.
     p.yaxis.formatter = FuncTickFormatter(code='''
@@ -190,15 +111,72 @@ def avg_round_trip(year, month, day):
     }
     return `${num}${unit}`
     ''')
-    
-    # Plot tools
-    p.add_tools(HoverTool(tooltips=[("y", "@y"), ("x", "@x{%Y/%m/%d %H:%M:%S}")], formatters={'@x' : 'datetime'}))
-    p.xaxis[0].formatter=DatetimeTickFormatter(
-        years = ['%Y/%m/%d %H:%M:%S'],
-        months = ['%Y/%m/%d %H:%M:%S'],
-        days = ['%Y/%m/%d %H:%M:%S'],
-        hours = ['%Y/%m/%d %H:%M:%S'],
-        minutes = ['%Y/%m/%d %H:%M:%S'],
-        seconds = ['%Y/%m/%d %H:%M:%S']
-        )
-    save(p)     # Save graph to output path
\ No newline at end of file
+    return p
+
+# Plot name -> plot function, in page order
+PLOTS = {
+    'throughput': throughput,
+    'avg-round-trip': avg_round_trip,
+    'min-round-trip': min_round_trip
+}
+
+def dashboard(label, data):     # <script> and <div> of every plot as one document - shared data and a linked time axis
+    from bokeh.layouts import column
+    from bokeh.embed import components
+
+    source = sources(data)
+    plots = [plot(label, source) for plot in PLOTS.values()]
+    for p in plots[1:]:         # Zooming or panning one plot moves the others
+        p.x_range = plots[0].x_range
+    script, div = components(column(plots, sizing_mode='stretch_width'))
+    return script + div
+
+def test_curves(filename, direction, series):     # Plots throughput, round trip times and retransmissions over one test
+    # Data Visualization library imports, loaded with the first plot
+    from bokeh.plotting import figure
+    from bokeh.layouts import column
+    from bokeh.embed import file_html
+    from bokeh.models import HoverTool
+
+    elapsed = series['elapsed_time'] / 1e6      # Seconds since the start of the test
+    color = 'red' if direction == 'download' else 'blue'
+    title = '{} test {}'.format(direction.capitalize(), filename)
+
+    # Throughput since the start of the test
+    p = figure(x_axis_label='Elapsed Time (s)', y_axis_label='Throughput (Mbit/s)', height=300, title=title)
+    p.title.text_font_size = '16pt'
+    p.line(x=elapsed, y=test_throughput(series), color=color, legend_label='Throughput (Mbit/s)')
+    p.circle(x=elapsed, y=test_throughput(series), color=color, legend_label='Throughput (Mbit/s)')
+
+    # Smoothed and minimum round trip time
+    rtt = figure(x_range=p.x_range, x_axis_label='Elapsed Time (s)', y_axis_label='Round Trip Time (ms)', height=250)
+    rtt.line(x=elapsed, y=series['rtt'] / 1e3, color=color, legend_label='Smoothed RTT (ms)')
+    rtt.line(x=elapsed, y=series['min_rtt'] / 1e3, color='black', line_dash='dashed', legend_label='Min RTT (ms)')
+
+    # Retransmitted bytes, bursts show as steps
+    retrans = figure(x_range=p.x_range, x_axis_label='Elapsed Time (s)', y_axis_label='Retransmitted (kB)', height=200)
+    retrans.step(x=elapsed, y=series['bytes_retrans'] / 1e3, color=color, mode='after')
+
+    for plot in (p, rtt, retrans):
+        plot.sizing_mode = 'stretch_width'
+        plot.add_tools(HoverTool(tooltips=[("y", "@y"), ("x", "@x s")]))
+    return file_html(column(p, rtt, retrans, sizing_mode='stretch_width'), resources(), title)     # Standalone graph HTML
+
+def cached_dashboard(key, version, label, start, end):     # Cached plots of a range, rendered from one fetch on a miss
+    html = render_cache.get('dashboard', key, version)
+    if html is None:
+        html = dashboard(label, range_measurements(start, end))
+        render_cache.put('dashboard', key, version, html)
+    return html
+
+def day_dashboard(year, month, day):    # Cached plots of a date
+    start, end = day_range(year, month, day)
+    version = day_version(start.date())
+    label = '{} {} {}'.format(lkup[month], day, year)
+    return cached_dashboard(start.date().isoformat(), version, label, start, end)
+
+def range_dashboard(start, end):        # Cached, downsampled plots of the dates in [start, end)
+    version = range_version(start.date(), end.date())
+    label = '{:%Y/%m/%d} to {:%Y/%m/%d}'.format(start, end - timedelta(days=1))
+    key = '{:%Y-%m-%d}_{:%Y-%m-%d}'.format(start, end)
+    return cached_dashboard(key, version, label, start, end)
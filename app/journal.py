@@ -0,0 +1,74 @@
+# Ingestion journal - tracks every listed NDT7 file until it is stored, failed files are retried by later runs
+# Files failing 'INGEST_MAX_ATTEMPTS' times, or that cannot be parsed, are quarantined so they never block the queue
+from app import db
+from flask import current_app
+from app.models import IngestFile
+
+# Helper libraries
+from datetime import datetime
+
+PENDING = ('listed', 'failed')      # States picked up by the next run
+
+def file_date(filename):        # UTC date of a test from its filename, e.g. ndt7-download-20220802T...
+    try:
+        return datetime.strptime(filename.split('-')[2][:8], '%Y%m%d').date()
+    except (IndexError, ValueError):
+        return None
+
+def chunks(items, size=500):    # Chunked to stay below SQLite's bound parameter limit
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def journaled(source, paths):   # Set of 'paths' of the source already in the journal
+    known = set()
+    for chunk in chunks(paths):
+        query = IngestFile.query.with_entities(IngestFile.path).filter(IngestFile.source == source, IngestFile.path.in_(chunk))
+        known.update(p for (p,) in query)
+    return known
+
+def add_listed(source, files):  # Journals newly listed files of the source - {path: filename} - in the current transaction
+    known = journaled(source, files)
+    rows = []
+    for path, filename in files.items():
+        if path in known:
+            continue
+        rows.append({
+            'source': source,
+            'path': path,
+            'filename': filename,
+            'direction': 'upload' if 'upload' in filename else 'download',
+            'date': file_date(filename),
+            'state': 'listed',
+            'attempts': 0,
+            'updated': datetime.utcnow()
+        })
+    db.session.bulk_insert_mappings(IngestFile, rows)
+    return len(rows)
+
+def pending(source, start=None, end=None, quarantined=False):     # Files of the source left to ingest, optionally of the dates [start, end]
+    states = PENDING + ('quarantined',) if quarantined else PENDING
+    query = IngestFile.query.filter(IngestFile.source == source, IngestFile.state.in_(states))
+    if start is not None:
+        query = query.filter(IngestFile.date >= start)
+    if end is not None:
+        query = query.filter(IngestFile.date <= end)
+    return query.order_by(IngestFile.id).all()
+
+def mark_stored(source, paths):     # Marks 'paths' of the source stored in the transaction that inserts their rows
+    for chunk in chunks(paths):
+        IngestFile.query.filter(IngestFile.source == source, IngestFile.path.in_(chunk)).update(
+            {'state': 'stored', 'error': None, 'updated': datetime.utcnow()}, synchronize_session=False)
+
+def mark_failed(entry, stage, error):       # Records a failed fetch or parse of one journaled file
+    entry.attempts = (entry.attempts or 0) + 1
+    entry.error = '{}: {!r}'.format(stage, error)[:1000]
+    entry.updated = datetime.utcnow()
+    if stage == 'parse' or entry.attempts >= current_app.config['INGEST_MAX_ATTEMPTS']:
+        entry.state = 'quarantined'
+        current_app.logger.error('Quarantined %s after %d attempts - %s', entry.path, entry.attempts, entry.error)
+    else:
+        entry.state = 'failed'
+
+def counts():           # Number of journaled files in each state
+    return dict(db.session.query(IngestFile.state, db.func.count(IngestFile.id)).group_by(IngestFile.state).all())
@@ -0,0 +1,206 @@
+# Process metrics in the Prometheus text exposition format - https://prometheus.io/docs/instrumenting/exposition_formats/
+# NDT7 sync stages and dashboard request latency, served at /metrics and by 'flask ingest --loop --metrics-port'
+
+# Flask
+from flask import Blueprint, current_app, request, g, Response
+
+# Helper libraries
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, time
+
+bp = Blueprint('metrics', __name__)
+
+REGISTRY = []       # Every metric, in exposition order
+
+# Upper bounds of latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def label_text(labels):     # {k="v",...} of a sample's labels
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels) + '}'
+
+class Metric(object):       # Base of labelled, thread-safe metrics
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}                    # Label values tuple -> value
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def key(self, labels):
+        return tuple((name, labels[name]) for name in self.labels)
+
+    def total(self):                        # Sum over all labels, used by run summaries
+        with self.lock:
+            return sum(self.values.values())
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, labels, value) for labels, value in sorted(self.values.items())]
+
+    def expose(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.kind)]
+        for name, labels, value in self.samples():
+            lines.append('{}{} {}'.format(name, label_text(labels), repr(float(value))))
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def set_max(self, value, **labels):     # Raises the gauge to 'value', never lowers it
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = max(value, self.values.get(key, value))
+
+class Histogram(Metric):   # Cumulative bucket counts, sum and count of observations
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        Metric.__init__(self, name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            buckets, count, total = self.values.get(key, ([0] * len(self.buckets), 0, 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    buckets[i] += 1
+            self.values[key] = (buckets, count + 1, total + value)
+
+    def total(self):            # Sum of observations over all labels
+        with self.lock:
+            return sum(total for buckets, count, total in self.values.values())
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        samples = []
+        for labels, (buckets, count, total) in items:
+            for bound, n in zip(self.buckets, buckets):
+                samples.append((self.name + '_bucket', labels + (('le', repr(float(bound))),), n))
+            samples.append((self.name + '_bucket', labels + (('le', '+Inf'),), count))
+            samples.append((self.name + '_sum', labels, total))
+            samples.append((self.name + '_count', labels, count))
+        return samples
+
+    @contextmanager
+    def time(self, **labels):   # Observes the duration of a 'with' block
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started, **labels)
+
+# NDT7 sync - 'source' is the kind of source, dropbox, directory or tar
+SYNC_RUNS = Counter('ndt7_sync_runs_total', 'NDT7 sync runs by outcome, ok or error.', ('source', 'outcome'))
+SYNC_SECONDS = Histogram('ndt7_sync_duration_seconds', 'Duration of NDT7 sync runs.', ('source',))
+LAST_SYNC = Gauge('ndt7_sync_last_success_timestamp_seconds', 'Unix time the last successful NDT7 sync run completed.', ('source',))
+NEWEST_TEST = Gauge('ndt7_newest_test_timestamp_seconds', 'Start time of the newest stored NDT7 test.', ('direction',))
+LIST_CALLS = Counter('ndt7_list_calls_total', 'Listing requests made to a source.', ('source',))
+LIST_SECONDS = Histogram('ndt7_list_duration_seconds', 'Duration of listing the files of a source.', ('source',))
+FILES_LISTED = Counter('ndt7_files_listed_total', 'Files listed by a source.', ('source',))
+FILES_NEW = Counter('ndt7_files_new_total', 'Listed files added to the ingestion journal.', ('source',))
+FILES_SKIPPED = Counter('ndt7_files_skipped_total', 'Listed files already journaled or stored.', ('source',))
+FILES_STORED = Counter('ndt7_files_stored_total', 'NDT7 files stored in the database.', ('direction',))
+FILES_FAILED = Counter('ndt7_files_failed_total', 'NDT7 files that failed to ingest.', ('stage',))
+RETRIES = Counter('ndt7_download_retries_total', 'Retried Dropbox downloads.')
+BYTES_READ = Counter('ndt7_bytes_read_total', 'Compressed NDT7 bytes downloaded or read.', ('source',))
+DOWNLOAD_SECONDS = Histogram('ndt7_download_duration_seconds', 'Duration of Dropbox file downloads, retries included.')
+DECOMPRESS_SECONDS = Histogram('ndt7_decompress_duration_seconds', 'Duration of decompressing one NDT7 file.')
+PARSE_SECONDS = Histogram('ndt7_parse_duration_seconds', 'Duration of decoding one NDT7 file into a row.')
+INSERT_SECONDS = Histogram('ndt7_insert_duration_seconds', 'Duration of inserting and committing one batch of rows.', ('direction',))
+
+# Dashboard requests
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Duration of HTTP requests.', ('endpoint', 'method'))
+REQUESTS = Counter('http_requests_total', 'HTTP requests answered.', ('endpoint', 'method', 'status'))
+
+# Totals of one sync run in its summary log line - name -> metric
+RUN_SUMMARY = [
+    ('listed', FILES_LISTED), ('new', FILES_NEW), ('skipped', FILES_SKIPPED), ('stored', FILES_STORED),
+    ('failed', FILES_FAILED), ('retries', RETRIES), ('bytes', BYTES_READ), ('list_calls', LIST_CALLS),
+    ('list_s', LIST_SECONDS), ('download_s', DOWNLOAD_SECONDS), ('decompress_s', DECOMPRESS_SECONDS),
+    ('parse_s', PARSE_SECONDS), ('insert_s', INSERT_SECONDS)
+]
+
+def source_kind(source):    # Label value of a source, e.g. 'tar' of 'tar:/path/to/archive.tar.gz'
+    return source.name.split(':')[0]
+
+def exposition():           # Every metric in the Prometheus text format
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
+
+@contextmanager
+def sync_run(source):       # Times one sync run of 'source' and logs a summary line of its totals
+    kind = source_kind(source)
+    before = [metric.total() for name, metric in RUN_SUMMARY]
+    started = perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        elapsed = perf_counter() - started
+        SYNC_SECONDS.observe(elapsed, source=kind)
+        SYNC_RUNS.inc(source=kind, outcome=outcome)
+        if outcome == 'ok':
+            LAST_SYNC.set(time(), source=kind)
+
+        parts = []
+        for (name, metric), total in zip(RUN_SUMMARY, before):
+            delta = metric.total() - total
+            parts.append('{}={}'.format(name, '{:.3f}'.format(delta) if name.endswith('_s') else int(delta)))
+        current_app.logger.info('NDT7 sync source=%s outcome=%s elapsed_s=%.3f %s', kind, outcome, elapsed, ' '.join(parts))
+
+# Dashboard request latency
+@bp.before_app_request
+def start_timer():
+    g.request_started = perf_counter()
+
+@bp.after_app_request
+def record_request(response):
+    if request.endpoint not in (None, 'static', 'metrics.metrics') and 'request_started' in g:
+        REQUEST_SECONDS.observe(perf_counter() - g.request_started, endpoint=request.endpoint, method=request.method)
+        REQUESTS.inc(endpoint=request.endpoint, method=request.method, status=response.status_code)
+    return response
+
+@bp.route('/metrics')
+def metrics():
+    return Response(exposition(), mimetype='text/plain; version=0.0.4')
+
+class MetricsHandler(BaseHTTPRequestHandler):   # Serves /metrics of processes without the web app, e.g. the ingest worker
+    def do_GET(self):
+        body = exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):   # Scrapes are not logged
+        pass
+
+def serve(port):            # Serves the metrics of this process on 'port' from a daemon thread
+    server = ThreadingHTTPServer(('', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -1,5 +1,6 @@
 # Flask app imports
-from app import app, db, login
+from app import db, login
+from flask import current_app, url_for
 from flask_login import UserMixin
 
 # Helper libraries
@@ -43,12 +44,12 @@ class User(UserMixin, db.Model):
     def get_reset_password_token(self, expires_in=600):     # token expires in 600 seconds
         return jwt.encode(
             {'reset_password': self.id, 'exp': time() + expires_in},
-            app.config['SECRET_KEY'], algorithm='HS256')
+            current_app.config['SECRET_KEY'], algorithm='HS256')
 
     @staticmethod   # Called without a class object
     def verify_reset_password_token(token):     # Token decryption
         try:
-            id = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])['reset_password']
+            id = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])['reset_password']
         except:
             return
         return User.query.get(id)
@@ -57,58 +58,143 @@ class User(UserMixin, db.Model):
 class Topic(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String, index=True, unique=True)                       # Forum title
-    timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)     # Forum timestamp in UTC
+    slug = db.Column(db.String, index=True, unique=True)                        # Forum URL name, see app/forum.py
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)                 # Forum timestamp in UTC
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))                   # Forum owner reference
+    post_count = db.Column(db.Integer, default=0)                               # Forum posts, counted as they are added
     posts = db.relationship('Post', backref='area', lazy='dynamic')             # Forum posts back reference
 
+    # Forum pages are read in (timestamp, id) order from a cursor
+    __table_args__ = (
+        db.Index('ix_topic_timestamp_id', 'timestamp', 'id'),
+    )
+
+    # Forum page URL, by id until the topic has a slug
+    def url(self, **kwargs):
+        if self.slug:
+            return url_for('main.post', slug=self.slug, **kwargs)
+        return url_for('main.post', topic_id=self.id, **kwargs)
+
 # Forum Post models
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    body = db.Column(db.String, index=True)                                     # Post content
+    body = db.Column(db.String)                                                 # Post content, searched through app/search.py
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)     # Post timestamp
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))                   # Post owner reference
     topic_id = db.Column(db.Integer, db.ForeignKey('topic.id'))                 # Post in Forum reference
 
+    # A thread's pages are read in (timestamp, id) order from a cursor
+    __table_args__ = (
+        db.Index('ix_post_topic_timestamp_id', 'topic_id', 'timestamp', 'id'),
+    )
+
+# Ingestion bookkeeping - persisted key/value pairs such as the Dropbox listing cursor
+class SyncState(db.Model):
+    key = db.Column(db.String, primary_key=True)        # State name
+    value = db.Column(db.String)                        # State value
+
+# Ingestion journal - one row per listed NDT7 file so interrupted syncs resume where they stopped
+class IngestFile(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String)                                   # Source the file was listed from, e.g. 'dropbox'
+    path = db.Column(db.String, index=True)                         # Path of the file in its source
+    filename = db.Column(db.String)                                 # Original NDT7 filename
+    direction = db.Column(db.String)                                # 'download' or 'upload'
+    date = db.Column(db.Date, index=True)                           # UTC date of the test from its filename
+    state = db.Column(db.String, index=True, default='listed')     # listed, stored, failed or quarantined
+    attempts = db.Column(db.Integer, default=0)                     # Failed fetch attempts
+    error = db.Column(db.String)                                    # Stage and error of the last failure
+    updated = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('source', 'path'),
+    )
+
+# Catalog of dates with NDT7 measurements - maintained by ingestion, the version is bumped whenever rows are added
+class MeasurementDay(db.Model):
+    date = db.Column(db.Date, primary_key=True)         # UTC date of NDT7 tests
+    version = db.Column(db.Integer, default=0)          # Data version of the date for render caches
+    downloads = db.Column(db.Integer, default=0)        # NDT7 download tests on the date
+    uploads = db.Column(db.Integer, default=0)          # NDT7 upload tests on the date
+
 # NDT7 download TCP_INFO data - https://github.com/m-lab/ndt-server/blob/main/spec/ndt7-protocol.md
 class Download(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    year = db.Column(db.String, index=True)
-    month = db.Column(db.String, index=True)
-    day = db.Column(db.String, index=True)
-    filename = db.Column(db.String, index=True)
-    time = db.Column(db.String, index=True)
-    client_ip = db.Column(db.String, index=True)
-    server_ip = db.Column(db.String, index=True)
-    busy_time = db.Column(db.Integer, index=True)
-    bytes_acked = db.Column(db.Integer, index=True)
-    bytes_received = db.Column(db.Integer, index=True)
-    bytes_sent = db.Column(db.Integer, index=True)
-    bytes_retrans = db.Column(db.Integer, index=True)
-    elapsed_time = db.Column(db.Integer, index=True)
-    min_rtt = db.Column(db.Integer, index=True)
-    rtt = db.Column(db.Integer, index=True)
-    rtt_var = db.Column(db.Integer, index=True)
-    rwnd_limited = db.Column(db.Integer, index=True)
-    snd_buf_limited = db.Column(db.Integer, index=True)
+    timestamp = db.Column(db.DateTime)                                  # Start time of NDT7 test in UTC
+    filename = db.Column(db.String, index=True, unique=True)
+    client_ip = db.Column(db.String)
+    server_ip = db.Column(db.String)
+    busy_time = db.Column(db.Integer)
+    bytes_acked = db.Column(db.Integer)
+    bytes_received = db.Column(db.Integer)
+    bytes_sent = db.Column(db.Integer)
+    bytes_retrans = db.Column(db.Integer)
+    elapsed_time = db.Column(db.Integer)
+    min_rtt = db.Column(db.Integer)
+    rtt = db.Column(db.Integer)
+    rtt_var = db.Column(db.Integer)
+    rwnd_limited = db.Column(db.Integer)
+    snd_buf_limited = db.Column(db.Integer)
+
+    # Date-range scans of the plotted metrics are answered from this index alone
+    __table_args__ = (
+        db.Index('ix_download_timestamp', 'timestamp', 'bytes_acked', 'elapsed_time', 'min_rtt', 'rtt'),
+    )
 
 # NDT7 upload TCP_INFO data - https://github.com/m-lab/ndt-server/blob/main/spec/ndt7-protocol.md
 class Upload(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    year = db.Column(db.String, index=True)
-    month = db.Column(db.String, index=True)
-    day = db.Column(db.String, index=True)
-    filename = db.Column(db.String, index=True)
-    time = db.Column(db.String, index=True)
-    client_ip = db.Column(db.String, index=True)
-    server_ip = db.Column(db.String, index=True)
-    busy_time = db.Column(db.Integer, index=True)
-    bytes_acked = db.Column(db.Integer, index=True)
-    bytes_received = db.Column(db.Integer, index=True)
-    bytes_sent = db.Column(db.Integer, index=True)
-    bytes_retrans = db.Column(db.Integer, index=True)
-    elapsed_time = db.Column(db.Integer, index=True)
-    min_rtt = db.Column(db.Integer, index=True)
-    rtt = db.Column(db.Integer, index=True)
-    rtt_var = db.Column(db.Integer, index=True)
-    rwnd_limited = db.Column(db.Integer, index=True)
-    snd_buf_limited = db.Column(db.Integer, index=True)
\ No newline at end of file
+    timestamp = db.Column(db.DateTime)                                  # Start time of NDT7 test in UTC
+    filename = db.Column(db.String, index=True, unique=True)
+    client_ip = db.Column(db.String)
+    server_ip = db.Column(db.String)
+    busy_time = db.Column(db.Integer)
+    bytes_acked = db.Column(db.Integer)
+    bytes_received = db.Column(db.Integer)
+    bytes_sent = db.Column(db.Integer)
+    bytes_retrans = db.Column(db.Integer)
+    elapsed_time = db.Column(db.Integer)
+    min_rtt = db.Column(db.Integer)
+    rtt = db.Column(db.Integer)
+    rtt_var = db.Column(db.Integer)
+    rwnd_limited = db.Column(db.Integer)
+    snd_buf_limited = db.Column(db.Integer)
+
+    # Date-range scans of the plotted metrics are answered from this index alone
+    __table_args__ = (
+        db.Index('ix_upload_timestamp', 'timestamp', 'bytes_received', 'elapsed_time', 'min_rtt', 'rtt'),
+    )
+
+# Every server measurement of one NDT7 test, packed by app/series.py - one row per test rather than per sample
+class TestSeries(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String, index=True, unique=True)    # Filename of the test's Download or Upload row
+    direction = db.Column(db.String)                            # download or upload
+    samples = db.Column(db.Integer)                             # Server measurements in the series
+    data = db.Column(db.LargeBinary)                            # zlib compressed column arrays
+
+# Hourly NDT7 summaries - one row per hour, test direction and metric
+class HourlyRollup(db.Model):
+    period = db.Column(db.DateTime, primary_key=True)       # Start of the hour in UTC
+    direction = db.Column(db.String, primary_key=True)      # 'download' or 'upload'
+    metric = db.Column(db.String, primary_key=True)         # 'throughput', 'min_rtt', 'rtt' or 'bytes_retrans'
+    count = db.Column(db.Integer)                           # Tests with a value for the metric
+    mean = db.Column(db.Float)
+    min = db.Column(db.Float)
+    max = db.Column(db.Float)
+    p50 = db.Column(db.Float)
+    p90 = db.Column(db.Float)
+    p99 = db.Column(db.Float)
+
+# Daily NDT7 summaries - one row per day, test direction and metric
+class DailyRollup(db.Model):
+    period = db.Column(db.DateTime, primary_key=True)       # Start of the day in UTC
+    direction = db.Column(db.String, primary_key=True)      # 'download' or 'upload'
+    metric = db.Column(db.String, primary_key=True)         # 'throughput', 'min_rtt', 'rtt' or 'bytes_retrans'
+    count = db.Column(db.Integer)                           # Tests with a value for the metric
+    mean = db.Column(db.Float)
+    min = db.Column(db.Float)
+    max = db.Column(db.Float)
+    p50 = db.Column(db.Float)
+    p90 = db.Column(db.Float)
+    p99 = db.Column(db.Float)
@@ -0,0 +1,85 @@
+# NDT7 archive parser - https://github.com/m-lab/ndt-server/blob/main/spec/ndt7-protocol.md
+# Decodes the .json.gz files written by the NDT server straight from memory
+
+# Helper libraries
+import gzip
+import json
+from datetime import datetime
+
+# Database column -> TCPInfo key of an NDT7 server measurement
+TCP_INFO = {
+    'busy_time': 'BusyTime',
+    'bytes_acked': 'BytesAcked',
+    'bytes_received': 'BytesReceived',
+    'bytes_sent': 'BytesSent',
+    'bytes_retrans': 'BytesRetrans',
+    'elapsed_time': 'ElapsedTime',
+    'min_rtt': 'MinRTT',
+    'rtt': 'RTT',
+    'rtt_var': 'RTTVar',
+    'rwnd_limited': 'RWndLimited',
+    'snd_buf_limited': 'SndBufLimited'
+}
+
+# Series column -> TCPInfo key of every NDT7 server measurement, 'bytes' is the direction's transferred bytes
+SAMPLE_INFO = {
+    'elapsed_time': 'ElapsedTime',
+    'bytes': None,
+    'rtt': 'RTT',
+    'min_rtt': 'MinRTT',
+    'bytes_retrans': 'BytesRetrans'
+}
+
+def load(content):      # Decompresses and decodes the bytes of an NDT7 .json.gz file
+    return json.loads(gzip.decompress(content))
+
+def test_result(d):     # The 'Download' or 'Upload' test result of a decoded NDT7 file
+    for key in ('Download', 'Upload'):
+        if d.get(key) is not None:
+            return d[key]
+    raise ValueError('No Download or Upload result in NDT7 file')
+
+def start_time(result):     # Start time of an NDT7 test result as a naive UTC datetime
+    stamp = result['StartTime']                 # eg. 2022-08-02T12:34:56.789012345Z
+    timestamp = datetime.strptime(stamp[:19], '%Y-%m-%dT%H:%M:%S')
+    fraction = stamp[20:].rstrip('Z')           # Fractional seconds are truncated to microseconds
+    if stamp[19:20] == '.' and fraction.isdigit():
+        timestamp = timestamp.replace(microsecond=int(fraction[:6].ljust(6, '0')))
+    return timestamp
+
+def record(content):    # Extracts one database row from the bytes of an NDT7 .json.gz file
+    return row(load(content))
+
+def row(d):             # Extracts one database row from a decoded NDT7 file
+    result = test_result(d)
+
+    row = {
+        'timestamp': start_time(result),        # Start time of NDT7 test in UTC
+        'client_ip': '',
+        'server_ip': ''
+    }
+
+    server_data = result.get('ServerMeasurements')
+    if not server_data:         # Test was dropped
+        row.update(dict.fromkeys(TCP_INFO))
+        return row
+
+    server_measurements = server_data[-1]       # Last recorded measurement
+
+    connection_info = server_measurements.get('ConnectionInfo') or {}
+    row['client_ip'] = connection_info.get('Client', '')        # Client IP address
+    row['server_ip'] = connection_info.get('Server', '')        # Server IP address
+
+    tcp_info = server_measurements['TCPInfo']
+    for column, key in TCP_INFO.items():
+        row[column] = tcp_info.get(key)
+    return row
+
+def samples(d):         # Columns of every server measurement of a decoded NDT7 file, empty for dropped tests
+    keys = dict(SAMPLE_INFO, bytes='BytesAcked' if d.get('Download') is not None else 'BytesReceived')
+    columns = {column: [] for column in keys}
+    for measurement in test_result(d).get('ServerMeasurements') or []:
+        tcp_info = measurement.get('TCPInfo') or {}
+        for column, key in keys.items():
+            columns[column].append(tcp_info.get(key) or 0)     # Missing counters are stored as 0
+    return columns
@@ -0,0 +1,55 @@
+# Columnar NDT7 measurement queries shared by the data plots
+from app import db
+from app.models import Download, Upload, MeasurementDay, SyncState
+
+# Helper libraries
+import numpy as np
+from datetime import datetime
+
+# Test direction -> (db entity, column of bytes transferred in that direction)
+DIRECTIONS = {
+    'download': (Download, 'bytes_acked'),      # Sent bytes during download
+    'upload': (Upload, 'bytes_received')        # Received bytes during upload
+}
+
+# SyncState key and format of the time ingestion last stored rows
+LAST_INGEST_KEY = 'last_ingest'
+LAST_INGEST_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+# Metrics plotted on the data dashboard - 'bytes' is the direction's transferred bytes column
+FIELDS = ['bytes', 'elapsed_time', 'min_rtt', 'rtt']
+
+def measurements(direction, start, end, fields=FIELDS):    # One direction's tests in [start, end) as NumPy arrays
+    model, bytes_column = DIRECTIONS[direction]
+    columns = [getattr(model, bytes_column if field == 'bytes' else field) for field in fields]
+
+    # Single ordered range scan of the timestamp index
+    rows = db.session.query(model.timestamp, *columns) \
+        .filter(model.timestamp >= start, model.timestamp < end) \
+        .order_by(model.timestamp).all()
+
+    # Rows -> columns; start times as datetime64 and metrics as floats with NaN for nulls
+    values = list(zip(*rows)) or [()] * (len(fields) + 1)
+    data = {'timestamp': np.array(values[0], dtype='datetime64[us]')}
+    for field, column in zip(fields, values[1:]):
+        data[field] = np.array(column, dtype=float)
+    return data
+
+def throughput(data):   # Throughput (Mbit/s) = bytes * 8 bits / elapsed time in micro-seconds
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = 8 * data['bytes'] / data['elapsed_time']
+    speed[~np.isfinite(speed)] = np.nan         # Dropped tests and zero elapsed times
+    return speed
+
+def day_version(date):      # Data version of a date, 0 when nothing was ingested for it
+    day = MeasurementDay.query.get(date)
+    return day.version if day is not None else 0
+
+def range_version(start, end):      # Data version of the dates in [start, end) - grows whenever any of them changes
+    version = db.session.query(db.func.sum(MeasurementDay.version)) \
+        .filter(MeasurementDay.date >= start, MeasurementDay.date < end).scalar()
+    return version or 0
+
+def last_ingest():          # UTC time ingestion last stored rows, None before the first run
+    state = SyncState.query.get(LAST_INGEST_KEY)
+    return datetime.strptime(state.value, LAST_INGEST_FORMAT) if state is not None else None
@@ -0,0 +1,82 @@
+# Hourly and daily NDT7 summaries - count, mean, min, max and percentiles per direction and metric
+# Ingestion refreshes the days it writes to, 'flask rebuild-rollups' recomputes everything
+from app import db
+from app.models import HourlyRollup, DailyRollup
+from app.queries import DIRECTIONS, measurements, throughput
+
+# Helper libraries
+import numpy as np
+from datetime import datetime, timedelta
+
+# Summarized metrics - 'throughput' is derived in Mbit/s, the others are TCPInfo columns
+ROLLUP_METRICS = ['throughput', 'min_rtt', 'rtt', 'bytes_retrans']
+
+# Resolution -> (db entity, NumPy datetime unit of its buckets)
+RESOLUTIONS = {
+    'hour': (HourlyRollup, 'h'),
+    'day': (DailyRollup, 'D')
+}
+
+def summaries(timestamps, values, unit):    # Rollup statistics of 'values' grouped into 'unit' buckets
+    buckets = timestamps.astype('datetime64[{}]'.format(unit))
+    valid = ~np.isnan(values)
+    for bucket in np.unique(buckets[valid]):
+        v = values[valid & (buckets == bucket)]
+        p50, p90, p99 = np.percentile(v, [50, 90, 99])
+        yield {
+            'period': bucket.astype('datetime64[us]').astype(datetime),
+            'count': int(v.size),
+            'mean': float(v.mean()),
+            'min': float(v.min()),
+            'max': float(v.max()),
+            'p50': float(p50),
+            'p90': float(p90),
+            'p99': float(p99)
+        }
+
+def refresh_day(direction, date):   # Recomputes the hourly and daily rollups of one direction and UTC date
+    start = datetime(date.year, date.month, date.day)
+    end = start + timedelta(days=1)
+    data = measurements(direction, start, end, ['bytes', 'elapsed_time', 'min_rtt', 'rtt', 'bytes_retrans'])
+    metrics = {
+        'throughput': throughput(data),
+        'min_rtt': data['min_rtt'],
+        'rtt': data['rtt'],
+        'bytes_retrans': data['bytes_retrans']
+    }
+
+    for model, unit in RESOLUTIONS.values():
+        model.query.filter(model.direction == direction, model.period >= start, model.period < end).delete(synchronize_session=False)
+        rows = []
+        for metric, values in metrics.items():
+            for row in summaries(data['timestamp'], values, unit):
+                row.update(direction=direction, metric=metric)
+                rows.append(row)
+        db.session.bulk_insert_mappings(model, rows)
+
+def refresh(direction, rows):       # Refreshes the rollups of every date that 'rows' were ingested for
+    for date in sorted({row['timestamp'].date() for row in rows}):
+        refresh_day(direction, date)
+
+def rebuild():          # Recomputes all rollups from the raw measurements, one committed day at a time
+    for model, _ in RESOLUTIONS.values():
+        model.query.delete()
+    db.session.commit()
+
+    days = 0
+    for direction, (model, _) in DIRECTIONS.items():
+        day = db.func.date(model.timestamp)
+        for (date,) in db.session.query(day).filter(model.timestamp != None).distinct().order_by(day).all():
+            refresh_day(direction, datetime.strptime(str(date)[:10], '%Y-%m-%d'))
+            db.session.commit()
+            days += 1
+    return days
+
+def series(resolution, direction, metric, start, end):     # Rollup rows of one direction and metric in [start, end)
+    model = RESOLUTIONS[resolution][0]
+    return model.query.filter(
+        model.direction == direction,
+        model.metric == metric,
+        model.period >= start,
+        model.period < end
+    ).order_by(model.period).all()
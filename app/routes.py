@@ -1,125 +1,128 @@
 # Flask app imports
-from app import app, db, scheduler
-from app.database import dropbox_storage
-from app.graph import throughput, min_round_trip, avg_round_trip
+from app import db
+from app.catalog import available_dates
+from app.graph import day_range, day_dashboard, range_dashboard, test_curves, resources
+from app.series import test_series
+from app.activity import last_seen
+from app.forum import paginate, create_topic, add_post, find_topic, starting_at, slugify
+from app.search import search as search_forum
 from app.forms import Date, RegistrationForm, LoginForm, Forum, Comments, EditProfileForm
-from app.models import Download, User, Topic, Post
+from app.models import User, Topic, Post
 from app.forms import ResetPasswordRequestForm
 from app.email import send_password_reset_email
 from app.forms import ResetPasswordForm
 
 # Flask Template Engine
-from flask import render_template, url_for, redirect, flash, request
+from flask import Blueprint, current_app, render_template, url_for, redirect, flash, request, abort, make_response
 
 # Flask Login Authentication
 from flask_login import current_user, login_user, logout_user
 
 # Helper Libraries
-from datetime import datetime
+import gzip
+from datetime import datetime, timedelta
 
-# Flask APScheduler - Calls 'dropbox_storage()' from database.py every 5 minutes
-@scheduler.task('interval', id='do_job_1', seconds=360)
-def update():
-    print('begin')
-    dropbox_storage()
-    print('done')
+bp = Blueprint('main', __name__)     # Dashboard, forum and account pages
 
-@app.route('/', methods=['GET', 'POST'])
-@app.route('/index', methods=['GET', 'POST'])       # Index page
+@bp.route('/', methods=['GET', 'POST'])
+@bp.route('/index', methods=['GET', 'POST'])       # Index page
 def index():
     form = Date()       # NDT7 test date selector form
-    # dates - Record of all NDT7 measurement timestamps
-    dates = Download.query.with_entities(Download.year, Download.month, Download.day).order_by(Download.year, Download.month, Download.day).all()
-    
-    # Unpacks 'dates' and filters for unique entries
-    tmp = []
-    j = 0
-    for item in dates:
-        if j == 0:
-            tmp.append(item)
-            j += 1
-        else:
-            if item == tmp[-1]:
-                continue
-            else:
-                tmp.append(item)
-    dates = tmp
+    dates = available_dates()       # Record of all NDT7 measurement dates
 
     # Date selector validation
     if form.validate_on_submit():
         y = form.year.data
         m = form.month.data
         d = form.day.data
-        return redirect(url_for('graph',year=y, month=m, day=d))
+        return redirect(url_for('main.graph',year=y, month=m, day=d))
     return render_template('index.html', title='Data Dashboard', form=form, dates=dates)
 
-@app.route('/forum', methods=['GET', 'POST'])       # Forum Root page
+@bp.route('/forum', methods=['GET', 'POST'])       # Forum Root page
 def forum():
     form = Forum()          # Forum creation form
     
     # Forum creation validation
     if form.validate_on_submit():
-        discussion = Topic(title=form.title.data, author=current_user)
-        db.session.add(discussion)
-        db.session.commit()
-        return redirect(url_for('forum'))
+        create_topic(form.title.data, current_user)
+        return redirect(url_for('main.forum'))
 
-    # Pagination
-    page = request.args.get('page', 1, type=int)
-    topics = Topic.query.order_by(Topic.timestamp.asc()).paginate(page, app.config['ITEMS_PER_PAGE'], False)
-    next_url = url_for('forum', page=topics.next_num) \
-        if topics.has_next else None
-    prev_url = url_for('forum', page=topics.prev_num) \
-        if topics.has_prev else None
+    # Keyset pagination
+    topics = cursor_page(Topic.query, Topic)
+    next_url = url_for('main.forum', after=topics.next_cursor) \
+        if topics.next_cursor else None
+    prev_url = url_for('main.forum', before=topics.prev_cursor) \
+        if topics.prev_cursor else None
 
-    return render_template('forum.html', title='Forum', topics=topics, form=form, next_url=next_url, prev_url=prev_url)
+    return render_template('forum.html', title='Forum', topics=topics, form=form, next_url=next_url, prev_url=prev_url,
+                           first_url=url_for('main.forum'), last_url=url_for('main.forum', last=1))
 
-@app.route('/forum/<post>', methods=['GET', 'POST'])        # Forum subpages
-def post(post):
+@bp.route('/forum/<int:topic_id>', methods=['GET', 'POST'])    # Forum subpages by id
+@bp.route('/forum/<slug>', methods=['GET', 'POST'])            # Forum subpages by slug
+def post(topic_id=None, slug=None):
     # Forum entity for reference to encapsulated posts
-    topic = Topic.query.filter_by(title=post).first()
+    topic = find_topic(topic_id, slug)
+    if topic is None:
+        # Title URLs of earlier versions, numeric titles such as /forum/2022 arrive as a topic id
+        name = slug if slug is not None else str(topic_id)
+        topic = Topic.query.filter_by(title=name).first() or find_topic(slug=slugify(name))
+        if topic is None:
+            abort(404)
+        return redirect(topic.url(), 301)
     
     form = Comments()       # Forum posts form
 
     # Forum posts validation
     if form.validate_on_submit():
-        comment = Post(body=form.body.data, author=current_user, area=topic)
-        db.session.add(comment)
-        db.session.commit()
-        return redirect(url_for('post', post=post))
+        add_post(topic, form.body.data, current_user)
+        return redirect(topic.url(last=1))
     
-    # Pagination
-    page = request.args.get('page', 1, type=int)
-    posts = Post.query.filter_by(topic_id=topic.id).order_by(Post.timestamp.asc()).paginate(page, app.config['ITEMS_PER_PAGE'], False)
-    next_url = url_for('post', post=post, page=posts.next_num) \
-        if posts.has_next else None
-    prev_url = url_for('post', post=post, page=posts.prev_num) \
-        if posts.has_prev else None
+    # Keyset pagination, positions come from the topic's post count
+    posts = cursor_page(Post.query.filter_by(topic_id=topic.id), Post, total=topic.post_count)
+    next_url = topic.url(after=posts.next_cursor) \
+        if posts.next_cursor else None
+    prev_url = topic.url(before=posts.prev_cursor) \
+        if posts.prev_cursor else None
+
+    return render_template('posts.html', title=topic.title, posts=posts, form=form, next_url=next_url, prev_url=prev_url,
+                           first_url=topic.url(), last_url=topic.url(last=1))
+
+@bp.route('/search')        # Forum search results
+def search():
+    q = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    hits, has_next = search_forum(q, page, current_app.config['ITEMS_PER_PAGE'])
+    next_url = url_for('main.search', q=q, page=page + 1) \
+        if has_next else None
+    prev_url = url_for('main.search', q=q, page=page - 1) \
+        if page > 1 else None
+
+    return render_template('search.html', title='Forum Search', q=q, hits=hits, page=page, starting_at=starting_at,
+                           next_url=next_url, prev_url=prev_url)
 
-    return render_template('posts.html', title=post, posts=posts, form=form, next_url=next_url, prev_url=prev_url)
+def cursor_page(query, model, total=None):      # Page of the 'after', 'before' or 'last' query argument
+    try:
+        return paginate(query, model, current_app.config['ITEMS_PER_PAGE'], after=request.args.get('after'),
+                        before=request.args.get('before'), last='last' in request.args, total=total)
+    except ValueError:
+        abort(400)
 
-@app.route('/about')        # About page
+@bp.route('/about')        # About page
 def about():
     return render_template("about.html", title="About")
 
-@app.route('/data/<year>/<month>/<day>', methods=['GET', 'POST'])       # Data Dashboard page
+def dashboard_page(form, dates, plots):    # Data Dashboard page with its plots inline, gzip compressed when the client accepts it
+    html = render_template("graph.html", title="Server-Side Visualization", form=form, dates=dates, plots=plots, bokeh_js=resources().render_js())
+    response = make_response(html)
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+@bp.route('/data/<year>/<month>/<day>', methods=['GET', 'POST'])       # Data Dashboard page
 def graph(year, month, day):
-    # dates - Record of all NDT7 measurement timestamps
-    dates = Download.query.with_entities(Download.year, Download.month, Download.day).order_by(Download.year, Download.month, Download.day).all()
-    
-    # Unpacks 'dates' and filters for unique entries
-    tmp = []
-    j = 0
-    for item in dates:
-        if j == 0:
-            tmp.append(item)
-            j += 1
-        else:
-            if item == tmp[-1]:
-                continue
-            else:
-                tmp.append(item)
-    dates = tmp
+    dates = available_dates()       # Record of all NDT7 measurement dates
     
     form = Date()   # NDT7 test date selector form
     # Date selector validation
@@ -127,19 +130,64 @@ def graph(year, month, day):
         y = form.year.data
         m = form.month.data
         d = form.day.data
-        return redirect(url_for('graph',year=y, month=m, day=d))
+        return redirect(url_for('main.graph',year=y, month=m, day=d))
     
-    # Function Calls - Data plots 
-    throughput(year, month, day)
-    min_round_trip(year, month, day)
-    avg_round_trip(year, month, day)
-    return render_template("graph.html", title="Server-Side Visualization", form=form, dates=dates)
+    try:                # Invalid dates, and the last representable day, have no graphs
+        start, end = day_range(year, month, day)
+    except (ValueError, OverflowError):
+        abort(404)
+    if (year, month, day) != (start.strftime('%Y'), start.strftime('%m'), start.strftime('%d')):
+        return redirect(url_for('main.graph', year=start.strftime('%Y'), month=start.strftime('%m'), day=start.strftime('%d')))
+
+    # Data plots are rendered and cached on the first request for the date
+    return dashboard_page(form, dates, day_dashboard(year, month, day))
+
+@bp.route('/data/tests/<filename>.html')     # Intra-test curves of one NDT7 test
+def test_plot(filename):
+    test = test_series(filename)
+    if test is None:
+        abort(404)
+
+    # Stored series never change
+    response = make_response(test_curves(filename, *test))
+    response.set_etag(filename)
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response.make_conditional(request)
+
+def range_args():       # [start, end) datetimes of the inclusive YYYY-MM-DD 'start' and 'end' query arguments
+    start = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d')
+    end = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d') + timedelta(days=1)
+    if end <= start:
+        raise ValueError('end is before start')
+    return start, end
 
-@app.route('/login', methods=['GET', 'POST'])       # Login page
+@bp.route('/data/range', methods=['GET', 'POST'])     # Data Dashboard page for a date range
+def graph_range():
+    dates = available_dates()       # Record of all NDT7 measurement dates
+
+    form = Date()   # NDT7 test date selector form
+    # Date selector validation
+    if form.validate_on_submit():
+        y = form.year.data
+        m = form.month.data
+        d = form.day.data
+        return redirect(url_for('main.graph',year=y, month=m, day=d))
+
+    try:
+        start, end = range_args()
+    except (ValueError, OverflowError):     # Malformed dates, or an end past the last representable day
+        flash('Enter a start and end date as YYYY-MM-DD with the start on or before the end')
+        return redirect(url_for('main.index'))
+
+    # Downsampled data plots are rendered and cached on the first request for the range
+    return dashboard_page(form, dates, range_dashboard(start, end))
+
+@bp.route('/login', methods=['GET', 'POST'])       # Login page
 def login():
     # Checks if user is logged-in
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     form = LoginForm()      # User login form
     
     # Login form validation
@@ -147,21 +195,21 @@ def login():
         user = User.query.filter_by(username=form.username.data).first()
         if user is None or not user.check_password(form.password.data):
             flash('Invalid username or password')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         login_user(user, remember=form.remember_me.data)
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     return render_template('login.html', title='Sign In', form=form)
 
-@app.route('/logout')       # logout request
+@bp.route('/logout')       # logout request
 def logout():
     logout_user()           # logs out logged-in user
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/register', methods=['GET', 'POST'])        # Registration page
+@bp.route('/register', methods=['GET', 'POST'])        # Registration page
 def register():
     # If user is logged in, redirect to index page
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     form = RegistrationForm()       # User registration form
 
     # Registration form validation   
@@ -171,21 +219,20 @@ def register():
         db.session.add(user)
         db.session.commit()
         flash('Congratulations, you are now a registered user!')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('register.html', title='Register', form=form)
 
-@app.route('/user/<username>')      # User profile page
+@bp.route('/user/<username>')      # User profile page
 def user(username):
     user = User.query.filter_by(username=username).first_or_404()
-    return render_template('user.html', user=user)
+    return render_template('user.html', user=user, last_seen=last_seen.seen(user))
 
-@app.before_request     # Called for every request
-def before_request():   # Sets the logged-in user's last seen timestamp
+@bp.before_app_request     # Called for every request
+def before_request():   # Records the logged-in user's last seen timestamp, written in batches by app/activity.py
     if current_user.is_authenticated:
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
+        last_seen.touch(current_user.id)
 
-@app.route('/edit_profile', methods=['GET', 'POST'])        # Edit profile page
+@bp.route('/edit_profile', methods=['GET', 'POST'])        # Edit profile page
 def edit_profile():
     form = EditProfileForm(current_user.username)       # Edit profile form
     
@@ -195,17 +242,17 @@ def edit_profile():
         current_user.about_me = form.about_me.data
         db.session.commit()
         flash('Your changes have been saved.')
-        return redirect(url_for('user', username=form.username.data))
+        return redirect(url_for('main.user', username=form.username.data))
     # retrieve current user profile info
     elif request.method == 'GET':
         form.username.data = current_user.username
         form.about_me.data = current_user.about_me
     return render_template('edit_profile.html', title='Edit Profile', form=form)
 
-@app.route('/reset_password_request', methods=['GET', 'POST'])      # Password Reset Request page 
+@bp.route('/reset_password_request', methods=['GET', 'POST'])      # Password Reset Request page 
 def reset_password_request():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     form = ResetPasswordRequestForm()       # Password reset request form
     
     # Password request form validation
@@ -214,20 +261,20 @@ def reset_password_request():
         if user:
             send_password_reset_email(user)
         flash('Check your email for the instructions to reset your password')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('reset_password_request.html', title='Reset Password', form=form)
 
-@app.route('/reset_password/<token>', methods=['GET', 'POST'])      # Password reset page
+@bp.route('/reset_password/<token>', methods=['GET', 'POST'])      # Password reset page
 def reset_password(token):
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     # Password reset token verification
     user = User.verify_reset_password_token(token)
 
     # If verification failed or unrecognized
     if not user:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     form = ResetPasswordForm()      # Password reset form
 
@@ -236,5 +283,5 @@ def reset_password(token):
         user.set_password(form.password.data)
         db.session.commit()
         flash('Your password has been reset.')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('reset_password.html', form=form)
\ No newline at end of file
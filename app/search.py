@@ -0,0 +1,136 @@
+# Forum search - SQLite FTS5 index of topic titles and post bodies, with a LIKE scan on other backends
+# The forum_search table is kept in sync with the topic and post tables by SQLite triggers, so every write path is covered
+# Rows are posts under their post id and topics under their negated topic id
+from app import db
+from app.models import Topic, Post
+
+# Helper libraries
+import re
+from collections import namedtuple
+from markupsafe import Markup, escape
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+TABLE = 'forum_search'              # FTS5 table name, its shadow tables share the prefix
+START, END = '\x02', '\x03'         # Match markers returned by FTS5, replaced by <mark> after escaping
+SNIPPET_TOKENS = 16                 # Tokens around the matches in a snippet
+SNIPPET_CHARS = 120                 # Characters around the first match in a LIKE snippet
+TITLE_WEIGHT = 2.0                  # bm25 weight of topic titles relative to post bodies
+
+# Search result - a post, or a topic whose title matched when 'post' is None
+Hit = namedtuple('Hit', ['topic', 'post', 'title', 'snippet'])
+
+SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS forum_search USING fts5(title, body, tokenize='unicode61 remove_diacritics 2')",
+    """CREATE TRIGGER IF NOT EXISTS forum_search_post_insert AFTER INSERT ON post BEGIN
+        INSERT INTO forum_search(rowid, title, body) VALUES (new.id, (SELECT title FROM topic WHERE id = new.topic_id), new.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS forum_search_post_update AFTER UPDATE OF body, topic_id ON post BEGIN
+        DELETE FROM forum_search WHERE rowid = old.id;
+        INSERT INTO forum_search(rowid, title, body) VALUES (new.id, (SELECT title FROM topic WHERE id = new.topic_id), new.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS forum_search_post_delete AFTER DELETE ON post BEGIN
+        DELETE FROM forum_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS forum_search_topic_insert AFTER INSERT ON topic BEGIN
+        INSERT INTO forum_search(rowid, title, body) VALUES (-new.id, new.title, '');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS forum_search_topic_update AFTER UPDATE OF title ON topic BEGIN
+        UPDATE forum_search SET title = new.title WHERE rowid = -new.id;
+        UPDATE forum_search SET title = new.title WHERE rowid IN (SELECT id FROM post WHERE topic_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS forum_search_topic_delete AFTER DELETE ON topic BEGIN
+        DELETE FROM forum_search WHERE rowid = -old.id;
+    END"""
+]
+
+def create(connection):     # Creates the FTS5 table and its triggers on SQLite builds with FTS5, returns whether it exists
+    if connection.dialect.name != 'sqlite':
+        return False
+    try:
+        for statement in SCHEMA:
+            connection.execute(db.text(statement))
+    except OperationalError:            # SQLite compiled without FTS5
+        return False
+    return True
+
+@event.listens_for(Post.__table__, 'after_create')
+def post_created(table, connection, **kw):      # db.create_all() creates the search index with the forum tables
+    create(connection)
+
+def include_object(object, name, type_, reflected, compare_to):     # Keeps 'flask db migrate' from dropping the search tables
+    return not (type_ == 'table' and reflected and compare_to is None and name.startswith(TABLE))
+
+def available():            # Whether searches can use the FTS5 table
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    return db.session.execute(db.text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': TABLE}).first() is not None
+
+def rebuild():              # Creates the search index if needed and refills it from the topic and post tables
+    with db.engine.begin() as connection:
+        if not create(connection):
+            return None
+        connection.execute(db.text('DELETE FROM forum_search'))
+        connection.execute(db.text("INSERT INTO forum_search(rowid, title, body) SELECT -id, title, '' FROM topic"))
+        connection.execute(db.text('INSERT INTO forum_search(rowid, title, body) '
+                                   'SELECT post.id, topic.title, post.body FROM post LEFT JOIN topic ON topic.id = post.topic_id'))
+        connection.execute(db.text("INSERT INTO forum_search(forum_search) VALUES ('optimize')"))
+        return connection.execute(db.text('SELECT count(*) FROM forum_search')).scalar()
+
+def terms(query):           # Words of a user's query, operators and punctuation are not FTS5 syntax here
+    return re.findall(r'\w+', query.lower())[:10]
+
+def marked(text):           # Escaped HTML of FTS5 output with its match markers as <mark>
+    text = escape(text or '')
+    return Markup(text.replace(START, Markup('<mark>')).replace(END, Markup('</mark>')))
+
+def highlight(text, words, width=None):    # Escaped HTML of 'text' with 'words' marked, cut to 'width' characters around the first one
+    text = text or ''
+    pattern = re.compile('|'.join(re.escape(w) for w in sorted(words, key=len, reverse=True)), re.IGNORECASE)
+    if width and len(text) > width:
+        found = pattern.search(text)
+        start = max(0, (found.start() if found else 0) - width // 3)
+        text = ('…' if start else '') + text[start:start + width] + ('…' if start + width < len(text) else '')
+
+    html, position = Markup(), 0
+    for match in pattern.finditer(text):
+        html += escape(text[position:match.start()]) + Markup('<mark>') + escape(match.group()) + Markup('</mark>')
+        position = match.end()
+    return html + escape(text[position:])
+
+def fts_search(words, offset, limit):      # [(rowid, title html, snippet html)] in bm25 order
+    query = ' '.join('"{}"'.format(w) for w in words[:-1]) + ' "{}"*'.format(words[-1])    # The last word may be typed partially
+    rows = db.session.execute(db.text(
+        "SELECT rowid, highlight(forum_search, 0, :start, :end), snippet(forum_search, 1, :start, :end, '…', :tokens) "
+        'FROM forum_search WHERE forum_search MATCH :query ORDER BY bm25(forum_search, :weight, 1.0) LIMIT :limit OFFSET :offset'),
+        {'start': START, 'end': END, 'tokens': SNIPPET_TOKENS, 'query': query, 'weight': TITLE_WEIGHT, 'limit': limit, 'offset': offset})
+    return [(rowid, marked(title), marked(snippet)) for rowid, title, snippet in rows]
+
+def like_search(words, offset, limit):     # [(post id, title html, snippet html)] of posts containing every word, newest first
+    query = db.session.query(Post.id, Topic.title, Post.body).join(Topic, Topic.id == Post.topic_id)
+    for word in words:
+        pattern = '%{}%'.format(word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+        query = query.filter(db.or_(Post.body.ilike(pattern, escape='\\'), Topic.title.ilike(pattern, escape='\\')))
+    rows = query.order_by(Post.timestamp.desc(), Post.id.desc()).offset(offset).limit(limit)
+    return [(id, highlight(title, words), highlight(body, words, SNIPPET_CHARS)) for id, title, body in rows]
+
+def search(query, page, per_page):         # (hits of the 1-based page, whether there is a next page)
+    words = terms(query)
+    if not words:
+        return [], False
+    find = fts_search if available() else like_search
+    rows = find(words, (page - 1) * per_page, per_page + 1)
+    rows, has_next = rows[:per_page], len(rows) > per_page
+
+    # Posts and topics of the page in two primary key lookups
+    posts = {p.id: p for p in Post.query.filter(Post.id.in_([r for r, _, _ in rows if r > 0]))}
+    topic_ids = {-r for r, _, _ in rows if r < 0} | {p.topic_id for p in posts.values()}
+    topics = {t.id: t for t in Topic.query.filter(Topic.id.in_(topic_ids))}
+
+    hits = []
+    for rowid, title, snippet in rows:
+        post = posts.get(rowid) if rowid > 0 else None
+        topic = topics.get(post.topic_id if post is not None else -rowid)
+        if topic is not None:
+            hits.append(Hit(topic, post, title, snippet if post is not None else None))
+    return hits, has_next
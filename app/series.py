@@ -0,0 +1,43 @@
+# Per-test NDT7 time series - every ServerMeasurements sample of a test packed into one compressed blob
+# Columns are stored back to back as little-endian arrays, so decoding is one decompression and NumPy views of its buffer
+from app.models import TestSeries
+
+# Helper libraries
+import zlib
+import numpy as np
+
+# Series column -> array type, in storage order
+COLUMNS = [
+    ('elapsed_time', '<i8'),    # Micro-seconds since the start of the test
+    ('bytes', '<i8'),           # BytesAcked of downloads, BytesReceived of uploads
+    ('rtt', '<u4'),             # Smoothed round trip time in micro-seconds
+    ('min_rtt', '<u4'),         # Minimum round trip time in micro-seconds
+    ('bytes_retrans', '<i8')
+]
+
+def pack(columns):      # (samples, compressed blob) of a {column: values} series, None for tests without samples
+    samples = len(columns['elapsed_time'])
+    if not samples:
+        return None
+    buffer = b''.join(np.asarray(columns[name], dtype=dtype).tobytes() for name, dtype in COLUMNS)
+    return samples, zlib.compress(buffer, 6)
+
+def unpack(blob, samples):      # {column: read-only NumPy array} of a packed series, views of one decompressed buffer
+    buffer = zlib.decompress(blob)
+    columns = {}
+    offset = 0
+    for name, dtype in COLUMNS:
+        columns[name] = np.frombuffer(buffer, dtype=dtype, count=samples, offset=offset)
+        offset += samples * np.dtype(dtype).itemsize
+    return columns
+
+def throughput(columns):    # Throughput (Mbit/s) since the start of the test at each sample
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = 8 * columns['bytes'] / columns['elapsed_time']
+    return np.where(np.isfinite(speed), speed, np.nan)
+
+def test_series(filename):  # (direction, columns) of a stored test or None
+    test = TestSeries.query.filter_by(filename=filename).first()
+    if test is None:
+        return None
+    return test.direction, unpack(test.data, test.samples)
@@ -0,0 +1,284 @@
+# NDT7 file sources - Dropbox, a local copy of the NDT server's datadir or a tar archive of it
+# Every source lists files as {path: filename} and yields parsed rows of requested paths for the same ingestion pipeline
+from app.models import SyncState
+from flask import current_app
+
+# NDT7 archive parser and ingestion metrics
+from app import ndt7, metrics, series
+
+# Helper libraries
+import dropbox
+import gzip
+import json
+import os
+import random
+import requests
+import tarfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from time import sleep, perf_counter
+
+# Transient Dropbox errors that are retried with backoff
+RETRYABLE_ERRORS = (
+    dropbox.exceptions.RateLimitError,
+    dropbox.exceptions.InternalServerError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout
+)
+
+CURSOR_KEY = 'dropbox_cursor'     # SyncState key of the persisted Dropbox listing cursor
+
+def list_changes(dbx, path):        # Lists NDT7 files added since the last run via the persisted listing cursor
+    state = SyncState.query.get(CURSOR_KEY)
+    entries = []
+
+    try:
+        if state is None:           # First run - full recursive listing of 'path'
+            result = dbx.files_list_folder(path, recursive=True)
+            metrics.LIST_CALLS.inc(source='dropbox')
+        else:                       # Later runs - only changes since the stored cursor
+            result = dbx.files_list_folder_continue(state.value)
+            metrics.LIST_CALLS.inc(source='dropbox')
+    except (dropbox.exceptions.ApiError, dropbox.exceptions.BadInputError) as e:
+        # Expired or malformed cursor - fall back to a full resync
+        if isinstance(e, dropbox.exceptions.ApiError) and not (
+                isinstance(e.error, dropbox.files.ListFolderContinueError) and e.error.is_reset()):
+            raise
+        current_app.logger.warning('Dropbox cursor rejected, running a full resync: %s', e)
+        result = dbx.files_list_folder(path, recursive=True)
+        metrics.LIST_CALLS.inc(source='dropbox')
+
+    entries.extend(result.entries)
+    while result.has_more:          # Listings are paginated
+        result = dbx.files_list_folder_continue(result.cursor)
+        metrics.LIST_CALLS.inc(source='dropbox')
+        entries.extend(result.entries)
+
+    # Only files are measurements - folders and deletions are skipped
+    files = [e for e in entries if isinstance(e, dropbox.files.FileMetadata)]
+    return files, result.cursor
+
+def download_file(dbx, path):       # Downloads one file, retrying transient errors with jittered exponential backoff
+    retries = current_app.config['INGEST_MAX_RETRIES']
+    started = perf_counter()
+    for attempt in range(retries + 1):
+        try:
+            metadata, result = dbx.files_download(path=path)
+            metrics.DOWNLOAD_SECONDS.observe(perf_counter() - started)
+            metrics.BYTES_READ.inc(len(result.content), source='dropbox')
+            return result.content
+        except RETRYABLE_ERRORS as e:
+            if attempt == retries:      # Retry limit of this file reached
+                raise
+            # Full jitter - sleep a random time up to the exponential backoff ceiling
+            delay = random.uniform(0, min(current_app.config['INGEST_BACKOFF_MAX'], current_app.config['INGEST_BACKOFF_BASE'] * 2 ** attempt))
+            if isinstance(e, dropbox.exceptions.RateLimitError) and e.backoff:
+                delay = max(delay, e.backoff)   # Never retry sooner than Dropbox asks
+            current_app.logger.warning('Retrying %s in %.1fs after %r', path, delay, e)
+            metrics.RETRIES.inc()
+            sleep(delay)
+
+class ParseError(Exception):   # Downloaded file is not a readable NDT7 result
+    pass
+
+def parse_content(content):     # (row, decompress seconds, parse seconds) of the bytes of one NDT7 file
+    try:
+        started = perf_counter()
+        data = gzip.decompress(content)
+        decompressed = perf_counter()
+        d = json.loads(data)
+        row = ndt7.row(d)
+        row['series'] = series.pack(ndt7.samples(d))     # Packed here so parse processes share the work
+    except Exception as e:
+        raise ParseError(e)
+    return row, decompressed - started, perf_counter() - decompressed
+
+def fetch_record(dbx, path):        # Downloads and parses one NDT7 file in memory
+    row, decompress, parse = parse_content(download_file(dbx, path))
+    metrics.DECOMPRESS_SECONDS.observe(decompress)
+    metrics.PARSE_SECONDS.observe(parse)
+    return row
+
+def fetch_records(dbx, paths, failures):   # Fetches 'paths' concurrently and yields (path, row) as each completes
+    app = current_app._get_current_object()
+
+    def fetch(path):            # Download threads read settings and log through the app
+        with app.app_context():
+            return fetch_record(dbx, path)
+
+    # Files are submitted in a bounded window and released as they are yielded,
+    # so a large sync never holds more than 'window' downloaded files in memory
+    paths = iter(paths)
+    window = app.config['INGEST_DOWNLOAD_WORKERS'] * 4
+    with ThreadPoolExecutor(max_workers=app.config['INGEST_DOWNLOAD_WORKERS']) as pool:
+        futures = {}
+        while True:
+            for path in islice(paths, window - len(futures)):
+                futures[pool.submit(fetch, path)] = path
+            if not futures:
+                break
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = futures.pop(future)
+                try:
+                    row = future.result()
+                except ParseError as e:     # Retrying cannot fix a malformed file
+                    current_app.logger.error('Failed to parse %s: %r', path, e.args[0])
+                    failures.append((path, 'parse', e.args[0]))
+                    continue
+                except Exception as e:      # Give up on this file for this run, the rest of the run continues
+                    current_app.logger.error('Failed to fetch %s: %r', path, e)
+                    failures.append((path, 'fetch', e))
+                    continue
+                yield path, row
+
+def dropbox_client():       # Dropbox authentication
+    return dropbox.Dropbox(
+                app_key = current_app.config['APP_KEY'],
+                app_secret = current_app.config['APP_SECRET'],
+                oauth2_refresh_token = current_app.config['OAUTH2_REFRESH_TOKEN']
+            )
+
+def list_day(dbx, path, date):      # NDT7 files of one UTC date - the NDT server writes them to <path>/YYYY/MM/DD
+    path = '{}/{:%Y/%m/%d}'.format(path, date)
+    try:
+        result = dbx.files_list_folder(path)
+        metrics.LIST_CALLS.inc(source='dropbox')
+    except dropbox.exceptions.ApiError as e:
+        if isinstance(e.error, dropbox.files.ListFolderError) and e.error.is_path():    # No tests that day
+            return []
+        raise
+    entries = list(result.entries)
+    while result.has_more:
+        result = dbx.files_list_folder_continue(result.cursor)
+        metrics.LIST_CALLS.inc(source='dropbox')
+        entries.extend(result.entries)
+    return [e for e in entries if isinstance(e, dropbox.files.FileMetadata)]
+
+class DropboxSource(object):      # NDT7 files in the Dropbox folder the NDT server syncs to
+    name = 'dropbox'
+
+    def __init__(self, dbx=None):   # Any client with the dropbox.Dropbox interface may be passed in, e.g. a local fake
+        self.dbx = dbx if dbx is not None else dropbox_client()
+        self.path = current_app.config['NDT7_PATH']
+
+    def list_changes(self):         # Files added since the last run and the listing cursor to persist once they are journaled
+        files, cursor = list_changes(self.dbx, self.path)
+        return {f.path_lower: f.name for f in files}, cursor
+
+    def list_day(self, date):       # Files of one UTC date
+        return {f.path_lower: f.name for f in list_day(self.dbx, self.path, date)}
+
+    def fetch(self, paths, failures):   # Downloads are I/O bound - parsed by a thread pool as they arrive
+        return fetch_records(self.dbx, paths, failures)
+
+def is_ndt7(filename):
+    return filename.startswith('ndt7-') and filename.endswith('.json.gz')
+
+# Parse processes return (path, row, (stage, error), (bytes, decompress seconds, parse seconds)) for the writer to record
+def read_record(path):          # Reads and parses one local NDT7 file - runs in a parse process
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+    except OSError as e:
+        return path, None, ('fetch', e), None
+    return parse_record((path, content))
+
+def parse_record(item):         # Parses the (path, bytes) of one NDT7 file - runs in a parse process
+    path, content = item
+    try:
+        row, decompress, parse = parse_content(content)
+    except ParseError as e:
+        return path, None, ('parse', e.args[0]), (len(content), 0, 0)
+    return path, row, None, (len(content), decompress, parse)
+
+def parse_all(func, items, failures, processes, kind):  # Yields (path, row) of 'items' parsed by 'func' over a process pool
+    def collect(results):
+        for path, row, error, stats in results:
+            if stats is not None:
+                metrics.BYTES_READ.inc(stats[0], source=kind)
+            if error is not None:
+                current_app.logger.error('Failed to %s %s: %r', error[0], path, error[1])
+                failures.append((path,) + error)
+                continue
+            metrics.DECOMPRESS_SECONDS.observe(stats[1])
+            metrics.PARSE_SECONDS.observe(stats[2])
+            yield path, row
+
+    if processes <= 1:          # Serial parsing in this process
+        yield from collect(map(func, items))
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        chunk = []              # Items are submitted in bounded chunks so large archives are never held in memory
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= processes * 64:
+                yield from collect(pool.map(func, chunk, chunksize=16))
+                chunk = []
+        yield from collect(pool.map(func, chunk, chunksize=16))
+
+class DirectorySource(object):  # Local copy of the NDT server's ndt7 datadir, laid out as <root>/YYYY/MM/DD/*.json.gz
+    def __init__(self, root, processes=None):
+        self.root = os.path.abspath(root)
+        self.name = 'directory:' + self.root
+        self.processes = processes or current_app.config['INGEST_PARSE_PROCESSES']
+
+    def files(self, top):       # NDT7 files below 'top'
+        metrics.LIST_CALLS.inc(source='directory')
+        found = {}
+        for dirpath, dirnames, filenames in os.walk(top):
+            for fn in filenames:
+                if is_ndt7(fn):
+                    found[os.path.join(dirpath, fn)] = fn
+        return found
+
+    def list_changes(self):     # Every file - the journal and stored filenames tell which are new
+        return self.files(self.root), None
+
+    def list_day(self, date):
+        return self.files(os.path.join(self.root, '{:%Y}'.format(date), '{:%m}'.format(date), '{:%d}'.format(date)))
+
+    def fetch(self, paths, failures):   # Reading, decompressing and parsing are spread over all cores
+        return parse_all(read_record, sorted(paths), failures, self.processes, 'directory')
+
+class TarSource(object):        # Tar archive (optionally compressed) of the NDT server's ndt7 datadir
+    def __init__(self, archive, processes=None):
+        self.archive = os.path.abspath(archive)
+        self.name = 'tar:' + self.archive
+        self.processes = processes or current_app.config['INGEST_PARSE_PROCESSES']
+
+    def members(self):          # Streams the NDT7 members of the archive in order
+        with tarfile.open(self.archive, 'r|*') as tar:
+            for member in tar:
+                if member.isfile() and is_ndt7(os.path.basename(member.name)):
+                    yield tar, member
+
+    def list_changes(self):
+        metrics.LIST_CALLS.inc(source='tar')
+        return {m.name: os.path.basename(m.name) for tar, m in self.members()}, None
+
+    def list_day(self, date):
+        metrics.LIST_CALLS.inc(source='tar')
+        day = '{:%Y/%m/%d}'.format(date)
+        return {m.name: os.path.basename(m.name) for tar, m in self.members() if os.path.dirname(m.name).endswith(day)}
+
+    def fetch(self, paths, failures):   # One sequential pass over the archive feeds the parse processes
+        wanted = set(paths)
+
+        def contents():
+            for tar, member in self.members():
+                if member.name in wanted:
+                    wanted.discard(member.name)
+                    yield member.name, tar.extractfile(member).read()
+
+        yield from parse_all(parse_record, contents(), failures, self.processes, 'tar')
+        for path in wanted:     # Journaled from an earlier copy of the archive
+            failures.append((path, 'fetch', KeyError('not in archive')))
+
+def local_source(path, processes=None):     # Directory or tar archive source of 'path'
+    if os.path.isdir(path):
+        return DirectorySource(path, processes)
+    if tarfile.is_tarfile(path):
+        return TarSource(path, processes)
+    raise ValueError('{} is neither a directory nor a tar archive'.format(path))
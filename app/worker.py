@@ -0,0 +1,60 @@
+# NDT7 ingestion worker - runs dropbox_storage() outside the web process, one sync at a time across processes
+from app import db
+from app.database import dropbox_storage
+from flask import current_app
+
+# Helper libraries
+import os
+from contextlib import contextmanager
+
+try:                        # POSIX advisory file locks
+    import fcntl
+except ImportError:         # Windows
+    fcntl = None
+    import msvcrt
+
+class LockHeld(Exception):  # Another process is already syncing
+    pass
+
+@contextmanager
+def ingest_lock(path, wait=False):     # Cross-process lock held for the duration of one sync, released if the process dies
+    f = open(path, 'a+')
+    try:
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if wait else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            raise LockHeld(path)
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))       # Holder's PID for operators
+        f.flush()
+        yield
+    finally:
+        f.close()                       # Closing the file releases the lock
+
+def run_ingest(wait=False):    # Runs one sync in the app context unless another process holds the lock - True if it ran
+    try:
+        with ingest_lock(current_app.config['INGEST_LOCK_FILE'], wait=wait), db.use_writer():
+            dropbox_storage()
+    except LockHeld:
+        current_app.logger.info('NDT7 sync already running in another process, skipped')
+        return False
+    return True
+
+def update(app):                # Each run logs a summary line of its stage timings and counters
+    with app.app_context():
+        run_ingest()
+
+def start_scheduler(app):       # Flask APScheduler - Calls 'dropbox_storage()' from database.py every 6 minutes in this process
+    from flask_apscheduler import APScheduler
+
+    # Runs are never overlapped - a late run is coalesced into one and skipped while another process syncs
+    scheduler = APScheduler()
+    scheduler.init_app(app)
+    scheduler.add_job(id='do_job_1', func=update, args=[app], trigger='interval', seconds=360, max_instances=1, coalesce=True)
+    scheduler.start()
+    return scheduler
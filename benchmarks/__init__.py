@@ -0,0 +1,7 @@
+# Performance benchmarks for the MIRC Data Dashboard - run from the project's root directory, eg.
+# python -m benchmarks.parse
+# Each prints its results as JSON so runs can be compared between commits:
+# parse - NDT7 file decoding, schema - measurement table layout, ingest - dropbox_storage() against an in-memory
+# Dropbox folder, dashboard - the plot builders and /data routes at 10k/100k/1M tests per day,
+# load - concurrent viewers one instance serves within a p95 latency target, startup - import time of each entry point
+# (the last run is checked in as benchmarks/startup.json)
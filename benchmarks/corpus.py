@@ -0,0 +1,97 @@
+# Synthetic NDT7 archives shaped like the files the NDT server writes to Dropbox
+# https://github.com/m-lab/ndt-server/blob/main/spec/ndt7-protocol.md
+
+# Helper libraries
+import gzip
+import json
+import random
+from datetime import datetime, timedelta
+
+def ndt7_file(direction, start, samples=40, dropped=False, rng=random):    # Bytes of one NDT7 .json.gz file
+    stamp = start.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    measurements = None
+    if not dropped:             # Dropped tests have no server measurements
+        measurements = []
+        acked = 0
+        for i in range(1, samples + 1):
+            acked += rng.randint(100000, 2000000)
+            min_rtt = rng.randint(2000, 40000)
+            measurements.append({
+                'ConnectionInfo': {'Client': '190.58.0.{}:{}'.format(rng.randint(1, 254), rng.randint(1024, 65535)),
+                                   'Server': '10.0.0.1:443', 'UUID': 'ndt-synthetic'},
+                'BBRInfo': {'BW': rng.randint(10 ** 5, 10 ** 7), 'MinRTT': min_rtt, 'PacingGain': 256, 'CwndGain': 512, 'ElapsedTime': i * 250000},
+                'TCPInfo': {
+                    'State': 1, 'CAState': 0, 'Retransmits': 0, 'Probes': 0, 'Backoff': 0, 'Options': 7,
+                    'WScale': 119, 'AppLimited': 0, 'RTO': 204000, 'ATO': 40000, 'SndMSS': 1448, 'RcvMSS': 536,
+                    'Unacked': rng.randint(0, 100), 'Sacked': 0, 'Lost': 0, 'Retrans': 0, 'Fackets': 0,
+                    'LastDataSent': 0, 'LastAckSent': 0, 'LastDataRecv': 0, 'LastAckRecv': 0, 'PMTU': 1500,
+                    'RcvSsThresh': 64076, 'RTT': min_rtt + rng.randint(0, 20000), 'RTTVar': rng.randint(100, 5000),
+                    'SndSsThresh': 2147483647, 'SndCwnd': rng.randint(10, 500), 'AdvMSS': 1448, 'Reordering': 3,
+                    'RcvRTT': 0, 'RcvSpace': 14480, 'TotalRetrans': 0, 'PacingRate': rng.randint(10 ** 6, 10 ** 8),
+                    'MaxPacingRate': -1, 'BytesAcked': acked if direction == 'download' else 0,
+                    'BytesReceived': acked if direction == 'upload' else 0, 'SegsOut': i * 100, 'SegsIn': i * 50,
+                    'NotsentBytes': 0, 'MinRTT': min_rtt, 'DataSegsIn': 0, 'DataSegsOut': i * 100, 'DeliveryRate': rng.randint(10 ** 5, 10 ** 7),
+                    'BusyTime': i * 250000, 'RWndLimited': 0, 'SndBufLimited': 0, 'Delivered': i * 100, 'DeliveredCE': 0,
+                    'BytesSent': acked + rng.randint(0, 10000), 'BytesRetrans': rng.randint(0, 5000), 'DSackDups': 0,
+                    'ReordSeen': 0, 'ElapsedTime': i * 250000
+                }
+            })
+    result = {
+        'StartTime': stamp,
+        'EndTime': (start + timedelta(seconds=10)).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+        'UUID': 'ndt-synthetic',
+        'ClientMetadata': [{'Name': 'client_library_name', 'Value': 'libndt7.js'}],
+        'ServerMetadata': None,
+        'ClientMeasurements': [],
+        'ServerMeasurements': measurements
+    }
+    d = {
+        'GitShortCommit': 'synthetic',
+        'Version': 'v0.20.0',
+        'ClientIP': '190.58.0.1',
+        'ClientPort': 50000,
+        'ServerIP': '10.0.0.1',
+        'ServerPort': 443,
+        'StartTime': stamp,
+        'EndTime': result['EndTime'],
+        direction.capitalize(): result
+    }
+    return gzip.compress(json.dumps(d).encode('ascii'))
+
+def ndt7_filename(direction, start, rng=random):      # Filename the NDT server gives an NDT7 archive
+    return 'ndt7-{}-{}Z.ndt-synthetic-{:08x}.json.gz'.format(
+        direction, start.strftime('%Y%m%dT%H%M%S.%f'), rng.getrandbits(32))
+
+def archive(days, tests_per_day, dropped=0.05, start=datetime(2022, 8, 1), root='/ndt-server/datadir/ndt7', seed=0):
+    # Yields (path, filename, bytes) of 'tests_per_day' download and upload tests per day laid out like the NDT server's datadir
+    rng = random.Random(seed)
+    for day in range(days):
+        date = start + timedelta(days=day)
+        for i in range(tests_per_day):
+            stamp = date + timedelta(seconds=i * 86400 / tests_per_day)
+            for direction in ('download', 'upload'):
+                filename = ndt7_filename(direction, stamp, rng)
+                content = ndt7_file(direction, stamp, dropped=rng.random() < dropped, rng=rng)
+                yield '{}/{:%Y/%m/%d}/{}'.format(root, date, filename), filename, content
+
+def rows(direction, count, start, seconds=86400, dropped=0.05, seed=0):
+    # Yields 'count' database rows of one direction spread over 'seconds' from 'start', as ingestion stores them
+    rng = random.Random(seed)
+    for i in range(count):
+        timestamp = start + timedelta(seconds=i * seconds / count)
+        row = {'timestamp': timestamp, 'filename': ndt7_filename(direction, timestamp, rng), 'client_ip': '', 'server_ip': ''}
+        if rng.random() < dropped:      # Dropped tests have no TCPInfo
+            row.update(dict.fromkeys(['busy_time', 'bytes_acked', 'bytes_received', 'bytes_sent', 'bytes_retrans', 'elapsed_time',
+                                      'min_rtt', 'rtt', 'rtt_var', 'rwnd_limited', 'snd_buf_limited']))
+            yield row
+            continue
+        transferred = rng.randint(10 ** 6, 10 ** 8)
+        min_rtt = rng.randint(2000, 40000)
+        row.update({
+            'client_ip': '190.58.0.{}:{}'.format(rng.randint(1, 254), rng.randint(1024, 65535)), 'server_ip': '10.0.0.1:443',
+            'busy_time': 10 ** 7, 'bytes_acked': transferred if direction == 'download' else 0,
+            'bytes_received': transferred if direction == 'upload' else 0, 'bytes_sent': transferred + rng.randint(0, 10000),
+            'bytes_retrans': rng.randint(0, 5000), 'elapsed_time': 10 ** 7, 'min_rtt': min_rtt,
+            'rtt': min_rtt + rng.randint(0, 20000), 'rtt_var': rng.randint(100, 5000), 'rwnd_limited': 0, 'snd_buf_limited': 0
+        })
+        yield row
@@ -0,0 +1,81 @@
+# Data dashboard cost by day size - the measurement query, the app/graph.py dashboard document and the /data page
+# Each size is seeded as its own day of a SQLite fixture
+# python -m benchmarks.dashboard [--rows 10000 100000 1000000] [--repeat 3]
+
+# Helper libraries
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks import fixture
+
+def best_of(repeat, func):      # Best wall time in milliseconds of 'func'
+    timings = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - begin) * 1e3)
+    return min(timings)
+
+def get(client, url, status=200):   # Requests 'url' and checks the response
+    response = client.get(url)
+    assert response.status_code == status, (url, response.status_code)
+    return response
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000], help='tests per seeded day')
+    parser.add_argument('--repeat', type=int, default=3, help='timing repetitions, the best is kept')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture.configure(tmp)
+        app = fixture.create()
+        from app import graph
+
+        results = []
+        for i, rows in enumerate(args.rows):
+            day = date(2022, 1, 1) + timedelta(days=i)
+            begin = time.perf_counter()
+            start, end = fixture.seed(day, rows, seed=i)
+            seeded = time.perf_counter() - begin
+
+            y, m, d = '{:%Y}'.format(day), '{:%m}'.format(day), '{:%d}'.format(day)
+            result = {'rows': rows, 'date': day.isoformat(), 'seed_s': seeded}
+            with app.app_context():
+                data = graph.range_measurements(start, end)
+                result['query_ms'] = best_of(args.repeat, lambda: graph.range_measurements(start, end))
+                result['dashboard_ms'] = best_of(args.repeat, lambda: graph.dashboard('label', data))
+
+            # Route - the page rendered from an empty plot cache and from a warm one, and the bytes a viewer downloads
+            client = app.test_client()
+            url = '/data/{}/{}/{}'.format(y, m, d)
+
+            def render():           # Empties the memory and disk caches first
+                graph.render_cache.memory.clear()
+                shutil.rmtree(app.config['RENDER_CACHE_DIR'], ignore_errors=True)
+                get(client, url)
+
+            result['page_cold_ms'] = best_of(args.repeat, render)
+            result['page_warm_ms'] = best_of(args.repeat, lambda: get(client, url))
+            result['page_bytes'] = len(get(client, url).data)
+            result['page_gzip_bytes'] = len(client.get(url, headers={'Accept-Encoding': 'gzip'}).data)
+            results.append(result)
+
+        # BokehJS is fetched once and then cached by the browser for a year
+        from bokeh import __version__
+        bokehjs = get(client, '/bokeh/{}/static/js/bokeh.min.js'.format(__version__))
+        bokehjs_gzip = client.get('/bokeh/{}/static/js/bokeh.min.js'.format(__version__), headers={'Accept-Encoding': 'gzip'})
+
+    print(json.dumps({
+        'benchmark': 'dashboard',
+        'bokehjs_bytes': len(bokehjs.data),
+        'bokehjs_gzip_bytes': len(bokehjs_gzip.data),
+        'results': results
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
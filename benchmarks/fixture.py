@@ -0,0 +1,73 @@
+# Throwaway SQLite fixture for benchmarks - the app reads its configuration when created, so configure() runs first
+# configure(directory); app = create(); seed(...)
+
+# Helper libraries
+import os
+import random
+from datetime import datetime, timedelta
+
+# Vocabulary of generated forum posts
+WORDS = ['download', 'upload', 'latency', 'throughput', 'rtt', 'server', 'client', 'test', 'slow', 'fast', 'network',
+         'trinidad', 'tobago', 'fibre', 'wifi', 'evening', 'morning', 'peak', 'isp', 'measurement', 'packet', 'loss']
+
+def configure(directory):       # Points the app's database, render cache and ingest lock into 'directory'
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directory, 'app.db')
+    os.environ['RENDER_CACHE_DIR'] = os.path.join(directory, 'plots')
+    os.environ['INGEST_LOCK_FILE'] = os.path.join(directory, 'ingest.lock')
+    os.environ['SCHEDULER_ENABLED'] = '0'
+
+app = None                      # App of the fixture, set by create()
+
+def create():                   # Creates the app and schema of a configured fixture
+    global app
+    from app import create_app, db
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+    return app
+
+def seed(date, tests, batch=10000, seed=0):    # Inserts 'tests' measurements on 'date', half downloads and half uploads
+    from app import db, catalog
+    from app.models import Download, Upload
+    from benchmarks.corpus import rows
+
+    start = datetime(date.year, date.month, date.day)
+    with app.app_context():
+        for model, direction in ((Download, 'download'), (Upload, 'upload')):
+            pending = []
+            for row in rows(direction, tests // 2, start, dropped=0.05, seed=seed):
+                pending.append(row)
+                if len(pending) >= batch:
+                    db.session.execute(model.__table__.insert(), pending)
+                    pending = []
+            if pending:
+                db.session.execute(model.__table__.insert(), pending)
+            db.session.commit()
+        catalog.rebuild()       # Dates and data versions of the seeded days
+    return start, start + timedelta(days=1)
+
+def seed_forum(topics, posts, seed=0):     # Inserts 'topics' forum topics with 'posts' posts each, returns their slugs
+    from app import db
+    from app.models import User, Topic, Post
+    from app.forum import slugify
+
+    rng = random.Random(seed)
+    start = datetime(2022, 1, 1)
+    titles = ['Topic {}'.format(i + 1) for i in range(topics)]
+    with app.app_context():
+        user = User(username='loadtest', email='loadtest@example.com')
+        user.set_password('loadtest')
+        db.session.add(user)
+        db.session.flush()
+        for i, title in enumerate(titles):
+            topic = Topic(title=title, slug=slugify(title), post_count=posts, timestamp=start + timedelta(hours=i), user_id=user.id)
+            db.session.add(topic)
+            db.session.flush()
+            db.session.execute(Post.__table__.insert(), [{
+                'body': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 60))),
+                'timestamp': start + timedelta(hours=i, minutes=j),
+                'user_id': user.id,
+                'topic_id': topic.id
+            } for j in range(posts)])
+        db.session.commit()
+    return [slugify(title) for title in titles]
@@ -0,0 +1,68 @@
+# dropbox_storage() against an in-memory Dropbox folder of synthetic NDT7 files - first sync, then an incremental one
+# python -m benchmarks.ingest [--days 3] [--tests-per-day 500] [--dropped 0.05] [--latency 0]
+
+# Helper libraries
+import argparse
+import json
+import tempfile
+import time
+
+from benchmarks import fixture
+from benchmarks.corpus import archive
+from tests.fake_dropbox import FakeDropbox
+
+# Stage totals reported from app.metrics, summed over files so concurrent stages can exceed the wall time - name -> metric attribute
+STAGES = {
+    'list_s': 'LIST_SECONDS',
+    'download_s': 'DOWNLOAD_SECONDS',
+    'decompress_s': 'DECOMPRESS_SECONDS',
+    'parse_s': 'PARSE_SECONDS',
+    'insert_s': 'INSERT_SECONDS'
+}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=3)
+    parser.add_argument('--tests-per-day', type=int, default=500, help='download and upload tests per day each')
+    parser.add_argument('--dropped', type=float, default=0.05, help='fraction of tests without server measurements')
+    parser.add_argument('--latency', type=float, default=0, help='seconds each fake Dropbox call takes')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture.configure(tmp)
+        app = fixture.create()
+        from app import metrics
+        from app.database import dropbox_storage
+
+        files = list(archive(args.days, args.tests_per_day, args.dropped))
+        dbx = FakeDropbox(files, latency=args.latency)
+        results = {}
+        with app.app_context():
+            for run in ('initial', 'incremental'):
+                before = {name: getattr(metrics, attr).total() for name, attr in STAGES.items()}
+                calls = dict(dbx.calls)
+                begin = time.perf_counter()
+                stored, failed = dropbox_storage(dbx)
+                elapsed = time.perf_counter() - begin
+                results[run] = {
+                    'seconds': elapsed,
+                    'stored': stored,
+                    'failed': failed,
+                    'files_per_s': stored / elapsed if stored else None,
+                    'stages': {name: getattr(metrics, attr).total() - before[name] for name, attr in STAGES.items()},
+                    'api_calls': {name: n - calls[name] for name, n in dbx.calls.items()}
+                }
+
+    print(json.dumps({
+        'benchmark': 'ingest',
+        'files': len(files),
+        'bytes': sum(len(content) for path, filename, content in files),
+        'days': args.days,
+        'tests_per_day': args.tests_per_day,
+        'dropped': args.dropped,
+        'latency': args.latency,
+        'results': results
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
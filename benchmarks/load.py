@@ -0,0 +1,183 @@
+# HTTP load test - seeds a SQLite fixture, starts the app and replays a mix of dashboard and forum requests at rising concurrency
+# Reports throughput, p50/p95/p99 latency and error rate per level, and the highest level that met the latency target
+# python -m benchmarks.load [--concurrency 1 2 4 8 16 32] [--duration 10] [--mix index=1,data=8,bokehjs=1,forum=1,post=1,search=1]
+# python -m benchmarks.load --url http://dashboard:5000 --dates 2022-08-02 --topic-titles General    (an already running instance)
+
+# Helper libraries
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import quote
+
+import bokeh
+import numpy as np
+import requests
+
+from benchmarks import fixture
+
+BOKEHJS = '/bokeh/{}/static/js/bokeh.min.js'.format(bokeh.__version__)     # Self-hosted BokehJS of the installed release
+
+def parse_mix(text):        # 'index=1,data=2' -> {'index': 1.0, 'data': 2.0}
+    mix = {}
+    for part in text.split(','):
+        kind, weight = part.split('=')
+        if kind not in ('index', 'data', 'bokehjs', 'forum', 'post', 'search'):
+            raise argparse.ArgumentTypeError('unknown request kind {}'.format(kind))
+        mix[kind] = float(weight)
+    return mix
+
+def request_path(kind, dates, topics, rng):     # Random URL path of one request kind
+    if kind == 'index':
+        return '/index'
+    if kind == 'forum':
+        return '/forum'
+    if kind == 'post':
+        return '/forum/' + quote(rng.choice(topics))
+    if kind == 'search':
+        return '/search?q=' + quote(' '.join(rng.sample(fixture.WORDS, 2)))
+    if kind == 'bokehjs':   # First visits fetch the script a dashboard page loads
+        return BOKEHJS
+    return '/data/{:%Y/%m/%d}'.format(rng.choice(dates))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(port):     # Flask's threaded server on the configured fixture, in its own process
+    env = dict(os.environ, FLASK_APP='main.py')
+    server = subprocess.Popen([sys.executable, '-m', 'flask', 'run', '--port', str(port), '--with-threads'],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = 'http://127.0.0.1:{}'.format(port)
+    for _ in range(100):
+        try:
+            requests.get(url + '/about', timeout=1)
+            return server, url
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError('app did not start on port {}'.format(port))
+
+def percentiles(latencies):     # p50, p95 and p99 in milliseconds
+    if not latencies:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1e3, [50, 95, 99])
+    return {'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+
+def run_level(url, concurrency, duration, mix, dates, topics, seed):   # Closed-loop clients for 'duration' seconds
+    kinds, weights = list(mix), list(mix.values())
+    results = []            # (kind, seconds, ok) of every request
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(n):
+        rng = random.Random(seed * 1000 + n)
+        session = requests.Session()
+        done = []
+        while time.perf_counter() < deadline:
+            kind = rng.choices(kinds, weights)[0]
+            begin = time.perf_counter()
+            try:
+                ok = session.get(url + request_path(kind, dates, topics, rng), timeout=60).status_code < 400
+            except requests.exceptions.RequestException:
+                ok = False
+            done.append((kind, time.perf_counter() - begin, ok))
+        with lock:
+            results.extend(done)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    begin = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - begin
+
+    level = {
+        'concurrency': concurrency,
+        'requests': len(results),
+        'throughput_rps': len(results) / elapsed,
+        'error_rate': sum(1 for r in results if not r[2]) / len(results) if results else None
+    }
+    level.update(percentiles([r[1] for r in results]))
+    level['kinds'] = {}
+    for kind in kinds:
+        rows = [r for r in results if r[0] == kind]
+        level['kinds'][kind] = dict(requests=len(rows), errors=sum(1 for r in rows if not r[2]), **percentiles([r[1] for r in rows]))
+    return level
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32], help='concurrent clients of each level')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per level')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('index=1,data=8,bokehjs=1,forum=1,post=1,search=1'), help='request kind weights')
+    parser.add_argument('--days', type=int, default=7, help='seeded days of measurements')
+    parser.add_argument('--tests-per-day', type=int, default=2000)
+    parser.add_argument('--topics', type=int, default=20, help='seeded forum topics')
+    parser.add_argument('--posts', type=int, default=50, help='seeded posts per topic')
+    parser.add_argument('--p95-target', type=float, default=500, help='p95 latency in ms a level must stay within to count as served')
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--cold', action='store_true', help='skip rendering every dashboard once before the first level')
+    parser.add_argument('--url', help='load an already running instance instead of a seeded local one')
+    parser.add_argument('--dates', help='comma separated YYYY-MM-DD dates with data on --url')
+    parser.add_argument('--topic-titles', help='comma separated forum topic slugs or titles on --url')
+    args = parser.parse_args()
+
+    tmp = None
+    server = None
+    try:
+        if args.url:
+            url = args.url.rstrip('/')
+            dates = [date.fromisoformat(d) for d in (args.dates or '').split(',') if d]
+            topics = [t for t in (args.topic_titles or '').split(',') if t]
+        else:
+            tmp = tempfile.TemporaryDirectory()
+            fixture.configure(tmp.name)
+            fixture.create()
+            dates = [date(2022, 8, 1) + timedelta(days=i) for i in range(args.days)]
+            for i, day in enumerate(dates):
+                fixture.seed(day, args.tests_per_day, seed=i)
+            topics = fixture.seed_forum(args.topics, args.posts)
+            server, url = start_server(free_port())
+
+        # Request kinds without targets are left out of the mix
+        mix = {k: w for k, w in args.mix.items() if w > 0 and (dates or k != 'data') and (topics or k != 'post')}
+
+        if not args.cold and 'data' in mix:     # Viewers mostly hit rendered plots, cold renders are a separate question
+            for day in dates:
+                requests.get('{}/data/{:%Y/%m/%d}'.format(url, day), timeout=600)
+
+        levels = []
+        for i, concurrency in enumerate(args.concurrency):
+            levels.append(run_level(url, concurrency, args.duration, mix, dates, topics, i))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if tmp is not None:
+            tmp.cleanup()
+
+    # Capacity - highest concurrency that kept p95 latency and errors within target
+    served = [l['concurrency'] for l in levels
+              if l['p95_ms'] is not None and l['p95_ms'] <= args.p95_target and l['error_rate'] <= args.max_error_rate]
+    print(json.dumps({
+        'benchmark': 'load',
+        'url': args.url,
+        'mix': mix,
+        'duration_s': args.duration,
+        'p95_target_ms': args.p95_target,
+        'capacity_concurrency': max(served) if served else 0,
+        'best_throughput_rps': max(l['throughput_rps'] for l in levels) if levels else None,
+        'levels': levels
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# Per-file NDT7 parse cost - the previous temporary file + pandas decode against app.ndt7
+# python -m benchmarks.parse [--files 200] [--samples 40]
+
+# Helper libraries
+import argparse
+import gzip
+import json
+import os
+import random
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from app import ndt7
+from benchmarks.corpus import ndt7_file
+
+def legacy_record(content):     # Decode path used by dropbox_storage() before app.ndt7
+    with open('tmp.gz', 'wb') as f:
+        f.write(content)
+    with gzip.open('tmp.gz', 'rb') as f:
+        d = json.loads(f.read().decode('ascii'))
+    os.unlink('tmp.gz')
+    df = pd.DataFrame(d.items())
+    start_time = df[1].iloc[8]['StartTime']
+    server_data = df[1].iloc[8]['ServerMeasurements']
+    return start_time, server_data[-1]['TCPInfo'] if server_data else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=200, help='synthetic NDT7 files to parse')
+    parser.add_argument('--samples', type=int, default=40, help='server measurements per file')
+    parser.add_argument('--repeat', type=int, default=5, help='timing repetitions, the best is kept')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    start = datetime(2022, 8, 2)
+    corpus = [ndt7_file(rng.choice(['download', 'upload']), start + timedelta(minutes=i), args.samples, rng.random() < 0.05, rng)
+              for i in range(args.files)]
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)           # legacy_record() writes tmp.gz to the working directory
+        try:
+            for name, parse in (('legacy', legacy_record), ('ndt7', ndt7.record)):
+                best = min(timeit.repeat(lambda: [parse(c) for c in corpus], number=1, repeat=args.repeat))
+                results[name] = {'per_file_us': best / len(corpus) * 1e6}
+        finally:
+            os.chdir(cwd)
+
+    results['speedup'] = results['legacy']['per_file_us'] / results['ndt7']['per_file_us']
+    print(json.dumps({'benchmark': 'parse', 'files': args.files, 'samples': args.samples, 'results': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
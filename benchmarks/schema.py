@@ -0,0 +1,107 @@
+# Download table schema - the year/month/day/time string columns with 19 indexes against the timestamp schema
+# Measures batched insert throughput and the latency of one day's /data/<y>/<m>/<d> query
+# python -m benchmarks.schema [--days 60] [--tests-per-day 500]
+
+# Helper libraries
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+from app.models import Download
+
+# Download table before the timestamp migration - every column indexed
+legacy_metadata = sa.MetaData()
+legacy = sa.Table(
+    'download', legacy_metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    *[sa.Column(name, sa.String, index=True) for name in ('year', 'month', 'day', 'filename', 'time', 'client_ip', 'server_ip')],
+    *[sa.Column(name, sa.Integer, index=True) for name in ('busy_time', 'bytes_acked', 'bytes_received', 'bytes_sent', 'bytes_retrans',
+                                                          'elapsed_time', 'min_rtt', 'rtt', 'rtt_var', 'rwnd_limited', 'snd_buf_limited')]
+)
+
+def synthetic_rows(days, per_day, rng):     # Download rows spread evenly over 'days' days from 2022-01-01
+    start = datetime(2022, 1, 1)
+    for i in range(days * per_day):
+        timestamp = start + timedelta(seconds=i * 86400 // per_day)
+        yield {
+            'timestamp': timestamp, 'filename': 'ndt7-download-{}.json.gz'.format(i),
+            'client_ip': '190.58.0.{}'.format(rng.randint(1, 254)), 'server_ip': '10.0.0.1',
+            'busy_time': rng.randint(0, 10 ** 7), 'bytes_acked': rng.randint(0, 10 ** 8), 'bytes_received': 0,
+            'bytes_sent': rng.randint(0, 10 ** 8), 'bytes_retrans': rng.randint(0, 10 ** 5), 'elapsed_time': 10 ** 7,
+            'min_rtt': rng.randint(2000, 40000), 'rtt': rng.randint(2000, 60000), 'rtt_var': rng.randint(0, 5000),
+            'rwnd_limited': 0, 'snd_buf_limited': 0
+        }
+
+def as_legacy(row):     # Row in the year/month/day/time string schema
+    row = dict(row)
+    timestamp = row.pop('timestamp')
+    row.update(year=timestamp.strftime('%Y'), month=timestamp.strftime('%m'), day=timestamp.strftime('%d'), time=timestamp.strftime('%H:%M:%S'))
+    return row
+
+def insert(engine, table, rows, batch):     # Rows per second of batched inserts, one transaction per batch
+    begin = time.perf_counter()
+    for i in range(0, len(rows), batch):
+        with engine.begin() as conn:
+            conn.execute(table.insert(), rows[i:i + batch])
+    return len(rows) / (time.perf_counter() - begin)
+
+def best_of(repeat, query):         # Best wall time in milliseconds of 'query'
+    timings = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        query()
+        timings.append((time.perf_counter() - begin) * 1e3)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--tests-per-day', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rows = list(synthetic_rows(args.days, args.tests_per_day, random.Random(0)))
+    day = datetime(2022, 1, 1) + timedelta(days=args.days // 2)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Before - string date columns, every column indexed
+        engine = sa.create_engine('sqlite:///' + os.path.join(tmp, 'legacy.db'))
+        legacy_metadata.create_all(engine)
+        legacy_rows = [as_legacy(r) for r in rows]
+        t = legacy.c
+        query = sa.select(t.bytes_acked, t.elapsed_time, t.year, t.month, t.day, t.time) \
+            .where(t.year == day.strftime('%Y'), t.month == day.strftime('%m'), t.day == day.strftime('%d')) \
+            .order_by(t.year, t.month, t.day, t.time)
+        with engine.connect() as conn:
+            results['legacy'] = {
+                'insert_rows_per_s': insert(engine, legacy, legacy_rows, args.batch),
+                'day_query_ms': best_of(args.repeat, lambda: conn.execute(query).fetchall()),
+                'plan': ' | '.join(r[-1] for r in conn.execute(sa.text('EXPLAIN QUERY PLAN ' + str(query.compile(compile_kwargs={'literal_binds': True})))))
+            }
+
+        # After - one timestamp column with a covering date-range index
+        engine = sa.create_engine('sqlite:///' + os.path.join(tmp, 'timestamp.db'))
+        table = Download.__table__
+        table.create(engine)
+        t = table.c
+        query = sa.select(t.bytes_acked, t.elapsed_time, t.timestamp) \
+            .where(t.timestamp >= day, t.timestamp < day + timedelta(days=1)).order_by(t.timestamp)
+        with engine.connect() as conn:
+            results['timestamp'] = {
+                'insert_rows_per_s': insert(engine, table, rows, args.batch),
+                'day_query_ms': best_of(args.repeat, lambda: conn.execute(query).fetchall()),
+                'plan': ' | '.join(r[-1] for r in conn.execute(sa.text('EXPLAIN QUERY PLAN ' + str(query.compile(engine, compile_kwargs={'literal_binds': True})))))
+            }
+
+    print(json.dumps({'benchmark': 'schema', 'rows': len(rows), 'tests_per_day': args.tests_per_day, 'results': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
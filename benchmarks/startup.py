@@ -0,0 +1,82 @@
+# Cold-start cost of each entry point - wall time of a fresh interpreter and its 'python -X importtime' profile
+# Reports the slowest top-level imports and which heavy libraries each entry point loads before doing any work
+# python -m benchmarks.startup [--repeat 5] [--top 10] [--output benchmarks/startup.json]
+
+# Helper libraries
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Entry point -> interpreter arguments, run from the project's root directory
+ENTRY_POINTS = {
+    'web': ['-c', 'import main'],                               # WSGI servers importing main:app
+    'cli': ['-m', 'flask', 'routes'],                           # Any 'flask' command, e.g. flask db upgrade
+    'worker': ['-c', 'import main; from app import worker'],    # What 'flask ingest' loads before its first sync
+}
+
+# Libraries the web process should only load on first use
+HEAVY = ['numpy', 'pandas', 'bokeh', 'dropbox', 'sendgrid', 'apscheduler', 'alembic']
+
+def profile(args, env):         # (wall seconds, [(cumulative us, self us, module)]) of one interpreter run
+    begin = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - begin
+    if result.returncode != 0:
+        raise RuntimeError('{} failed:\n{}'.format(' '.join(args), result.stderr[-2000:]))
+
+    imports = []
+    for line in result.stderr.splitlines():     # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), int(own), name.rstrip()))
+    return wall, imports
+
+def top_level(imports):         # Imports made directly by the entry point, not by another module
+    return [(c, s, name.strip()) for c, s, name in imports if not name.startswith('  ')]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5, help='interpreter runs per entry point, the median is kept')
+    parser.add_argument('--top', type=int, default=10, help='slowest modules reported per entry point')
+    parser.add_argument('--output', help='also write the report to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, FLASK_APP='main.py', SCHEDULER_ENABLED='0',
+                   DATABASE_URL='sqlite:///' + os.path.join(tmp, 'app.db'),
+                   RENDER_CACHE_DIR=os.path.join(tmp, 'plots'))
+        results = {}
+        for name, entry in ENTRY_POINTS.items():
+            runs = [profile(entry, env) for _ in range(args.repeat)]
+            imports = runs[-1][1]
+            modules = {m.strip() for _, _, m in imports}
+            slowest = sorted(imports, key=lambda i: i[1], reverse=True)[:args.top]
+            results[name] = {
+                'command': 'python ' + ' '.join(entry),
+                'wall_ms': statistics.median(r[0] for r in runs) * 1e3,
+                'import_ms': statistics.median(sum(c for c, _, _ in top_level(r[1])) for r in runs) / 1e3,
+                'modules': len(modules),
+                'heavy_loaded': [lib for lib in HEAVY if lib in modules],
+                'slowest_self_ms': {m.strip(): s / 1e3 for _, s, m in slowest}
+            }
+
+    report = json.dumps({
+        'benchmark': 'startup',
+        'python': sys.version.split()[0],
+        'repeat': args.repeat,
+        'entry_points': results
+    }, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+
+if __name__ == '__main__':
+    main()
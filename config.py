@@ -12,17 +12,85 @@ class Config(object):
     # SQLAlchemy track modifications
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # SQLite tuning - write-ahead logging lets dashboard reads run while ingestion writes
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE') or 'wal'
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000)           # Milliseconds to wait for a lock
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'normal'               # 'normal' is safe with WAL
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE') or -65536)             # Pages, or KiB when negative, per connection
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)    # Bytes of the file memory-mapped
+
+    # Connection pool of each engine
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE') or 5)
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW') or 10)
+    DATABASE_POOL_RECYCLE = 1800                                                        # Seconds, server databases only
+
+    # Read-only engine for queries outside write transactions - a replica URL, or the main database when unset
+    DATABASE_READ_URL = os.environ.get('DATABASE_READ_URL')
+    DATABASE_READ_ROUTING = os.environ.get('DATABASE_READ_ROUTING', '1') != '0'
+
+    # Users' last seen times are buffered in memory and written in batches at most this many seconds late,
+    # or as soon as this many users are pending
+    LAST_SEEN_FLUSH_SECONDS = int(os.environ.get('LAST_SEEN_FLUSH_SECONDS') or 60)
+    LAST_SEEN_MAX_PENDING = int(os.environ.get('LAST_SEEN_MAX_PENDING') or 500)
+
     # Paginated items per page - forum titles and forum posts 
     ITEMS_PER_PAGE = 10
 
+    # Rendered plot cache - entries kept in memory per process and total bytes on disk
+    RENDER_CACHE_DIR = os.environ.get('RENDER_CACHE_DIR') or os.path.join(basedir, 'cache', 'plots')
+    RENDER_CACHE_ENTRIES = 64
+    RENDER_CACHE_BYTES = 256 * 1024 * 1024
+
+    # Gzip variants of the BokehJS files the app serves
+    ASSET_CACHE_DIR = os.environ.get('ASSET_CACHE_DIR') or os.path.join(basedir, 'cache', 'assets')
+
+    # Points per plotted series - longer series are downsampled to keep pages light
+    PLOT_POINT_BUDGET = 2000
+
     # FlaskAPScheduler Status
     SCHEDULER_API_ENABLED = True
+
+    # Run the NDT7 sync scheduler inside 'python main.py' - set to 0 when a separate 'flask ingest --loop' worker syncs
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', '1') != '0'
+
+    # Lock file that allows only one NDT7 sync at a time across processes
+    INGEST_LOCK_FILE = os.environ.get('INGEST_LOCK_FILE') or os.path.join(basedir, 'ingest.lock')
     
     # Sendgrid API key
     MAIL_PASSWORD = ''
     MAIL_DEFAULT_SENDER = ''
 
+    # Email delivery - 'sendgrid', 'capture' (kept in memory and written to MAIL_CAPTURE_DIR when set) or 'package.module:Class'
+    MAIL_TRANSPORT = os.environ.get('MAIL_TRANSPORT') or 'sendgrid'
+    MAIL_CAPTURE_DIR = os.environ.get('MAIL_CAPTURE_DIR')
+    MAIL_TIMEOUT = 10                                                               # Seconds per SendGrid request
+
+    # Attempts per email with exponential backoff (seconds) before it is written to the dead-letter file
+    MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS') or 6)
+    MAIL_BACKOFF_BASE = 2
+    MAIL_BACKOFF_MAX = 600
+    MAIL_DEAD_LETTER_FILE = os.environ.get('MAIL_DEAD_LETTER_FILE') or os.path.join(basedir, 'logs', 'mail-dead-letter.jsonl')
+    MAIL_SHUTDOWN_SECONDS = 10                                                      # Wait for queued emails on a clean shutdown
+
     # Dropbox API
     APP_KEY = "",
     APP_SECRET = "",
-    OAUTH2_REFRESH_TOKEN = ""
\ No newline at end of file
+    OAUTH2_REFRESH_TOKEN = ""
+
+    # Dropbox folder the NDT server writes NDT7 measurements to
+    NDT7_PATH = '/ndt-server/datadir/ndt7'
+
+    # NDT7 rows written per database transaction during ingestion
+    INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE') or 500)
+
+    # Concurrent Dropbox downloads and per-file retries with exponential backoff (seconds)
+    INGEST_DOWNLOAD_WORKERS = int(os.environ.get('INGEST_DOWNLOAD_WORKERS') or 8)
+    INGEST_MAX_RETRIES = int(os.environ.get('INGEST_MAX_RETRIES') or 5)
+    INGEST_BACKOFF_BASE = 0.5
+    INGEST_BACKOFF_MAX = 60
+
+    # Sync runs a file may fail to download in before it is quarantined - unparsable files are quarantined at once
+    INGEST_MAX_ATTEMPTS = int(os.environ.get('INGEST_MAX_ATTEMPTS') or 3)
+
+    # Processes decompressing and parsing files of local directory and tar archive sources, 1 parses in-process
+    INGEST_PARSE_PROCESSES = int(os.environ.get('INGEST_PARSE_PROCESSES') or os.cpu_count() or 1)
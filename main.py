@@ -1,4 +1,9 @@
-from app import app
+from app import create_app
+
+app = create_app()
 
 if __name__ == '__main__':
-    app.run()
\ No newline at end of file
+    if app.config['SCHEDULER_ENABLED']:     # Sync NDT7 data in this process unless a separate 'flask ingest' worker does
+        from app.worker import start_scheduler
+        start_scheduler(app)
+    app.run()
@@ -0,0 +1,31 @@
+# Shared fixtures - every test gets its own app on a SQLite database in a temporary directory
+import pytest
+
+from app import create_app, db
+from config import Config
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'app.db')
+        RENDER_CACHE_DIR = str(tmp_path / 'plots')
+        INGEST_LOCK_FILE = str(tmp_path / 'ingest.lock')
+        INGEST_PARSE_PROCESSES = 1          # Parsed in the test process
+        INGEST_BACKOFF_BASE = 0
+        SCHEDULER_ENABLED = False
+        MAIL_TRANSPORT = 'capture'
+        MAIL_DEAD_LETTER_FILE = str(tmp_path / 'mail-dead-letter.jsonl')
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        for engine in (db.get_engine(app), db.get_reader(app)):
+            if engine is not None:
+                engine.dispose()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,62 @@
+# In-memory stand-in for the dropbox.Dropbox client - the listing and download calls ingestion makes, without an account
+# dropbox_storage(FakeDropbox(files)) ingests 'files' exactly as it would a live Dropbox folder
+
+# Helper libraries
+import time
+from types import SimpleNamespace
+
+import dropbox
+from dropbox.files import FileMetadata, ListFolderResult, ListFolderError, ListFolderContinueError, LookupError
+
+class FakeDropbox(object):
+    def __init__(self, files=(), page_size=2000, latency=0):
+        self.files = {}             # Lowercase path -> (display path, bytes), in upload order
+        self.page_size = page_size  # Entries per listing page, Dropbox returns up to 2000
+        self.latency = latency      # Seconds each API call takes, to model the network round trip
+        self.calls = {'files_list_folder': 0, 'files_list_folder_continue': 0, 'files_download': 0}
+        for path, filename, content in files:
+            self.add(path, content)
+
+    def add(self, path, content):   # Uploads a file, later listings with an older cursor report it
+        self.files[path.lower()] = (path, content)
+
+    def call(self, name):
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def page(self, paths, offset):  # One listing page of 'paths' from 'offset' - cursors encode the folder and position
+        path, recursive, start = offset
+        end = min(start + self.page_size, len(paths))
+        entries = []
+        for p in paths[start:end]:
+            display, content = self.files[p]
+            entries.append(FileMetadata(name=display.rsplit('/', 1)[1], id='id:' + p, path_lower=p, path_display=display, size=len(content)))
+        cursor = '{}|{}|{}'.format(path, int(recursive), end)
+        return ListFolderResult(entries=entries, cursor=cursor, has_more=end < len(paths))
+
+    def listed(self, path, recursive):  # Paths in 'path', every file below it when recursive
+        folder = path.lower().rstrip('/') + '/'
+        return [p for p in self.files if p.startswith(folder) and (recursive or '/' not in p[len(folder):])]
+
+    def files_list_folder(self, path, recursive=False):
+        self.call('files_list_folder')
+        paths = self.listed(path, recursive)
+        if not paths:
+            raise dropbox.exceptions.ApiError('fake', ListFolderError.path(LookupError.not_found), None, None)
+        return self.page(paths, (path, recursive, 0))
+
+    def files_list_folder_continue(self, cursor):
+        self.call('files_list_folder_continue')
+        try:
+            path, recursive, start = cursor.rsplit('|', 2)
+        except ValueError:
+            raise dropbox.exceptions.ApiError('fake', ListFolderContinueError.reset, None, None)
+        recursive = recursive == '1'
+        return self.page(self.listed(path, recursive), (path, recursive, int(start)))
+
+    def files_download(self, path):
+        self.call('files_download')
+        display, content = self.files[path.lower()]
+        metadata = FileMetadata(name=display.rsplit('/', 1)[1], id='id:' + path, path_lower=path.lower(), path_display=display, size=len(content))
+        return metadata, SimpleNamespace(content=content)
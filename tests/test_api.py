@@ -0,0 +1,31 @@
+# Data API query arguments
+import pytest
+from datetime import datetime
+
+from app.api import parse_time
+
+def test_parse_time_keeps_naive_times():
+    assert parse_time('2022-08-01', 'start') == datetime(2022, 8, 1)
+    assert parse_time('2022-08-01T10:30:00', 'start') == datetime(2022, 8, 1, 10, 30)
+
+def test_parse_time_converts_offsets_to_utc():
+    time = parse_time('2022-08-01T00:00:00+02:00', 'start')
+    assert time == datetime(2022, 7, 31, 22, 0)
+    assert time.tzinfo is None
+
+def test_parse_time_rejects_other_values():
+    with pytest.raises(ValueError):
+        parse_time('yesterday', 'start')
+
+def test_measurements_accept_offset_arguments(client):
+    response = client.get('/api/v1/measurements?start=2022-08-01T00:00:00%2B02:00&end=2022-08-02T00:00:00Z')
+    assert response.status_code == 200
+
+def test_parse_time_rejects_offsets_out_of_range():
+    with pytest.raises(ValueError):
+        parse_time('0001-01-01T00:00:00+02:00', 'start')
+
+def test_measurements_reject_a_start_without_a_following_day(client):
+    response = client.get('/api/v1/measurements?start=9999-12-31')
+    assert response.status_code == 400
+    assert 'start' in response.get_json()['error']
@@ -0,0 +1,80 @@
+# Email queue - retries with backoff, dead letters and delivery of queued mail on shutdown
+import json
+import time
+
+import pytest
+
+from app.email import MailQueue, MailError, CaptureTransport
+
+class FlakyTransport(CaptureTransport):     # Fails the first 'failures' sends with 'error', then captures messages
+    def __init__(self, config, failures, error):
+        CaptureTransport.__init__(self, config)
+        self.failures = failures
+        self.error = error
+        self.attempts = 0
+
+    def send(self, message):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise self.error
+        CaptureTransport.send(self, message)
+
+@pytest.fixture
+def mail(app):
+    app.config.update(MAIL_BACKOFF_BASE=0.01, MAIL_MAX_ATTEMPTS=3)
+    queue = MailQueue()
+    queue.init_app(app)
+    return queue
+
+def settled(queue, timeout=5):      # Waits until every queued message is delivered or given up on
+    deadline = time.monotonic() + timeout
+    while queue.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return not queue.pending()
+
+def dead_letters(app):
+    with open(app.config['MAIL_DEAD_LETTER_FILE']) as f:
+        return [json.loads(line) for line in f]
+
+def send(queue):
+    return queue.send('Subject', 'dashboard@example.com', ['user@example.com'], '<p>Body</p>')
+
+def test_failed_sends_are_retried(app, mail):
+    mail.transport = FlakyTransport(app.config, 2, MailError('SendGrid 503'))
+    id = send(mail)
+    assert settled(mail)
+    assert [m['id'] for m in mail.transport.outbox] == [id]
+    assert mail.transport.outbox[0]['attempts'] == 3
+
+def test_messages_are_dead_lettered_after_the_last_attempt(app, mail):
+    mail.transport = FlakyTransport(app.config, 10, MailError('SendGrid 503'))
+    id = send(mail)
+    assert settled(mail)
+    assert mail.transport.outbox == []
+    letters = dead_letters(app)
+    assert [(m['id'], m['attempts']) for m in letters] == [(id, 3)]
+    assert 'SendGrid 503' in letters[0]['error']
+
+def test_rejected_messages_are_not_retried(app, mail):
+    mail.transport = FlakyTransport(app.config, 10, MailError('SendGrid 400', retry=False))
+    send(mail)
+    assert settled(mail)
+    assert mail.transport.attempts == 1
+    assert dead_letters(app)[0]['attempts'] == 1
+
+def test_close_delivers_queued_messages(app, mail):
+    ids = [send(mail) for _ in range(3)]
+    mail.close(timeout=5)
+    assert mail.pending() == 0
+    assert sorted(m['id'] for m in mail.transport.outbox) == ids
+
+def test_close_dead_letters_messages_waiting_for_a_retry(app, mail):
+    mail.transport = FlakyTransport(app.config, 1, MailError('SendGrid 429', after=60))
+    id = send(mail)
+    deadline = time.monotonic() + 5
+    while not mail.retries and time.monotonic() < deadline:
+        time.sleep(0.01)
+    mail.close(timeout=0.1)
+    assert mail.pending() == 0
+    assert mail.transport.outbox == []
+    assert [m['id'] for m in dead_letters(app)] == [id]
@@ -0,0 +1,50 @@
+# Read/write routing - web reads use the read engine, ingestion reads stay on the writer
+from datetime import datetime
+from sqlalchemy import event
+
+from app import db, worker
+from app.database import dropbox_storage
+from app.models import Download, SyncState
+from benchmarks.corpus import archive, ndt7_file, ndt7_filename
+from tests.fake_dropbox import FakeDropbox
+
+def read_bind():        # Engine a plain SELECT of the current session is sent to
+    return db.session.get_bind(clause=db.select(SyncState.key))
+
+def reader_statements(app):     # Statements executed on the read engine, appended as they run
+    statements = []
+    event.listen(db.get_reader(app), 'before_cursor_execute', lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+def test_reads_use_the_read_engine_outside_writes(app):
+    assert read_bind() is db.get_reader(app)
+    db.session.add(SyncState(key='test', value='1'))
+    db.session.flush()
+    assert read_bind() is db.engine     # Reads after a write see its uncommitted rows
+    db.session.commit()
+    assert read_bind() is db.get_reader(app)
+
+def test_use_writer_pins_reads_across_commits(app):
+    with db.use_writer():
+        assert read_bind() is db.engine
+        db.session.commit()
+        assert read_bind() is db.engine
+        with db.use_writer():
+            pass
+        assert read_bind() is db.engine
+    assert read_bind() is db.get_reader(app)
+
+def test_sync_reads_follow_the_writer(app, monkeypatch):
+    dbx = FakeDropbox(archive(1, 2))
+    statements = reader_statements(app)
+    dropbox_storage(dbx)
+    assert statements       # Without pinning the cursor, known filenames and journal are read from the read engine
+
+    del statements[:]
+    start = datetime(2022, 8, 2, 9)
+    dbx.add('/ndt-server/datadir/ndt7/2022/08/02/' + ndt7_filename('download', start), ndt7_file('download', start))
+    monkeypatch.setattr(worker, 'dropbox_storage', lambda: dropbox_storage(dbx))
+    assert worker.run_ingest()
+    assert statements == []
+    assert Download.query.count() == 3
+    assert read_bind() is db.get_reader(app)
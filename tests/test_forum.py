@@ -0,0 +1,89 @@
+# Forum pages - keyset pagination, cursors and topic URLs
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.forum import paginate, parse_cursor, cursor, slugify
+from app.models import User, Topic, Post
+
+@pytest.fixture
+def topic(app):     # Topic with 25 posts a minute apart
+    user = User(username='tester', email='tester@example.com')
+    db.session.add(user)
+    topic = Topic(title='Slow evenings', slug=slugify('Slow evenings'), post_count=25, author=user)
+    db.session.add(topic)
+    start = datetime(2022, 8, 1)
+    for i in range(25):
+        db.session.add(Post(body='post {}'.format(i + 1), timestamp=start + timedelta(minutes=i), author=user, area=topic))
+    db.session.commit()
+    return topic
+
+def page(topic, total=25, **kwargs):
+    return paginate(Post.query.filter_by(topic_id=topic.id), Post, 10, total=total, **kwargs)
+
+def bodies(page):
+    return [int(post.body.split()[1]) for post in page.items]
+
+def test_pages_follow_their_cursors(topic):
+    first = page(topic)
+    assert (bodies(first), first.first, first.has_prev, first.has_next) == (list(range(1, 11)), 1, False, True)
+
+    second = page(topic, after=first.next_cursor)
+    assert (bodies(second), second.first) == (list(range(11, 21)), 11)
+
+    third = page(topic, after=second.next_cursor)
+    assert (bodies(third), third.first, third.last, third.has_next) == (list(range(21, 26)), 21, 25, False)
+
+    back = page(topic, before=third.prev_cursor)
+    assert (bodies(back), back.first) == (list(range(11, 21)), 11)
+
+def test_last_page_positions_come_from_the_total(topic):
+    last = page(topic, last=True)
+    assert (bodies(last), last.first, last.total, last.has_next) == (list(range(16, 26)), 16, 25, False)
+
+    before = page(topic, before=last.prev_cursor)
+    assert (bodies(before), before.first, before.has_prev) == (list(range(6, 16)), 6, True)
+
+    start = page(topic, before=before.prev_cursor)
+    assert (bodies(start), start.first, start.has_prev) == (list(range(1, 6)), 1, False)
+
+def test_stale_totals_never_give_impossible_positions(topic):
+    low = page(topic, total=4, last=True)
+    assert bodies(low) == list(range(16, 26))
+    assert (low.first, low.total) == (None, None)
+
+    high = page(topic, total=40)
+    assert (high.first, high.total) == (1, 40)      # Not provably wrong from the first page
+    end = page(topic, total=20, after=page(topic, after=page(topic).next_cursor).next_cursor)
+    assert (end.first, end.total) == (21, 25)
+
+def test_parse_cursor_round_trips(topic):
+    post = Post.query.first()
+    assert parse_cursor(cursor(post, 7)) == (post.timestamp, post.id, 7)
+    assert parse_cursor(cursor(post)) == (post.timestamp, post.id, None)
+
+@pytest.mark.parametrize('value', ['', 'abc', '20220801000000000000', '20220801000000000000.x', '2022.1.2', '20220801000000000000.1.-5',
+                                   '20220801000000000000.1.2.3'])
+def test_parse_cursor_rejects_tampered_cursors(value):
+    with pytest.raises(ValueError):
+        parse_cursor(value)
+
+def test_tampered_cursor_is_a_bad_request(client, topic):
+    assert client.get('/forum/slow-evenings?after=20220801000000000000.1.-5').status_code == 400
+    assert client.get('/forum/slow-evenings?before=garbage').status_code == 400
+
+def test_edited_positions_are_dropped(client, topic):
+    tampered = page(topic, after='{}.0'.format(cursor(Post.query.order_by(Post.id).all()[9])))     # Position 0 after ten posts
+    assert bodies(tampered) == list(range(11, 21))
+    assert tampered.first is None
+    assert client.get('/forum/slow-evenings?before=20220801001500000000.16.3').status_code == 200
+
+def test_numeric_legacy_title_redirects_to_the_slug(client, app):
+    topic = Topic(title='2022', slug=slugify('2022'), post_count=0)
+    db.session.add(topic)
+    db.session.commit()
+    response = client.get('/forum/2022')
+    assert response.status_code == 301
+    assert response.headers['Location'].endswith('/forum/thread-2022')
+    assert client.get('/forum/2023').status_code == 404
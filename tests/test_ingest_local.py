@@ -0,0 +1,51 @@
+# flask ingest-local - a local ndt7 datadir or a tar archive of it, stored through the same journal as the Dropbox sync
+import os
+import tarfile
+from datetime import datetime
+
+import pytest
+
+from app.models import Download, Upload, IngestFile
+from benchmarks.corpus import archive, ndt7_filename
+
+CORRUPT = ndt7_filename('download', datetime(2022, 8, 1, 12))
+
+@pytest.fixture
+def datadir(tmp_path):      # ndt7 datadir of 2 days with 2 tests each and one unreadable file
+    root = tmp_path / 'ndt7'
+    files = [(path[len('/ndt-server/datadir/ndt7/'):], content) for path, filename, content in archive(2, 2)]
+    files.append(('2022/08/01/' + CORRUPT, b'truncated'))
+    for path, content in files:
+        os.makedirs(os.path.dirname(root / path), exist_ok=True)
+        with open(root / path, 'wb') as f:
+            f.write(content)
+    return root
+
+@pytest.fixture
+def tarball(tmp_path, datadir):     # The datadir as a compressed tar archive
+    path = tmp_path / 'ndt7.tar.gz'
+    with tarfile.open(path, 'w:gz') as tar:
+        tar.add(datadir, arcname='ndt7')
+    return path
+
+def ingest_local(app, path):
+    result = app.test_cli_runner().invoke(args=['ingest-local', str(path)])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+@pytest.mark.parametrize('source', ['datadir', 'tarball'])
+def test_ingest_local_stores_files_once(app, request, source):
+    path = request.getfixturevalue(source)
+
+    assert 'Stored 8 NDT7 files, 1 failed' in ingest_local(app, path)
+    stored = {row.filename for model in (Download, Upload) for row in model.query}
+    assert stored == {filename for path, filename, content in archive(2, 2)}
+    assert Download.query.filter(Download.timestamp >= datetime(2022, 8, 2)).count() == 2
+    corrupt = IngestFile.query.filter(IngestFile.filename == CORRUPT).one()
+    assert corrupt.state == 'quarantined'
+    assert corrupt.error.startswith('parse')
+
+    # A second run finds nothing new and does not retry the quarantined file
+    assert 'Stored 0 NDT7 files, 0 failed' in ingest_local(app, path)
+    assert Download.query.count() + Upload.query.count() == 8
+    assert IngestFile.query.filter(IngestFile.filename == CORRUPT).one().attempts == 1
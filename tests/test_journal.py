@@ -0,0 +1,90 @@
+# Ingestion journal - failed files are retried until quarantined, unreadable files and conflicting rows never block a run
+from datetime import datetime
+
+from app import db
+from app.database import dropbox_storage
+from app.models import Download, IngestFile
+from benchmarks.corpus import archive, ndt7_file, ndt7_filename
+from tests.fake_dropbox import FakeDropbox
+
+ROOT = '/ndt-server/datadir/ndt7'
+
+class FailingDropbox(FakeDropbox):  # Downloads of 'broken' paths fail every time
+    def __init__(self, files=(), broken=()):
+        FakeDropbox.__init__(self, files)
+        self.broken = set(broken)
+
+    def files_download(self, path):
+        if path.lower() in self.broken:
+            self.call('files_download')
+            raise RuntimeError('connection reset')
+        return FakeDropbox.files_download(self, path)
+
+class RacingDropbox(FakeDropbox):   # Another process stores 'filename' while it is being downloaded
+    def __init__(self, files, filename):
+        FakeDropbox.__init__(self, files)
+        self.filename = filename
+
+    def files_download(self, path):
+        if path.endswith(self.filename.lower()):
+            with db.engine.begin() as connection:
+                connection.execute(Download.__table__.insert(), {'filename': self.filename, 'timestamp': datetime(2022, 8, 1)})
+        return FakeDropbox.files_download(self, path)
+
+def entry(path):
+    return IngestFile.query.filter_by(path=path.lower()).one()
+
+def test_failed_files_are_retried_then_quarantined(app):
+    files = list(archive(1, 2))
+    broken = files[0][0]
+    dbx = FailingDropbox(files, broken=[broken.lower()])
+
+    assert dropbox_storage(dbx) == (3, 1)
+    assert entry(broken).state == 'failed'
+    assert entry(broken).attempts == 1
+
+    for attempt in range(2, app.config['INGEST_MAX_ATTEMPTS'] + 1):
+        assert dropbox_storage(dbx) == (0, 1)
+        assert entry(broken).attempts == attempt
+    assert entry(broken).state == 'quarantined'
+    assert entry(broken).error.startswith('fetch')
+
+    # Quarantined files are left alone by later runs
+    downloads = dbx.calls['files_download']
+    assert dropbox_storage(dbx) == (0, 0)
+    assert dbx.calls['files_download'] == downloads
+
+def test_unreadable_files_are_quarantined_at_once(app):
+    dbx = FakeDropbox(archive(1, 1))
+    filename = ndt7_filename('download', datetime(2022, 8, 1, 12))
+    path = '{}/2022/08/01/{}'.format(ROOT, filename)
+    dbx.add(path, b'not gzip')
+
+    assert dropbox_storage(dbx) == (2, 1)
+    assert entry(path).state == 'quarantined'
+    assert entry(path).attempts == 1
+    assert entry(path).error.startswith('parse')
+
+def test_rows_stored_by_another_run_are_journaled_stored(app):
+    files = list(archive(1, 3, dropped=0))
+    filename = [fn for path, fn, content in files if '-download-' in fn][0]
+    dbx = RacingDropbox(files, filename)
+
+    assert dropbox_storage(dbx) == (5, 0)
+    assert Download.query.count() == 3
+    assert IngestFile.query.filter_by(state='stored').count() == 6
+
+def test_conflicting_batch_is_marked_failed(app):
+    start = datetime(2022, 8, 1, 12)
+    filename = ndt7_filename('download', start)
+    dbx = FakeDropbox(archive(1, 1))
+    copies = ['{}/2022/08/{:02d}/{}'.format(ROOT, day, filename) for day in (1, 2)]     # The same test in two folders
+    for path in copies:
+        dbx.add(path, ndt7_file('download', start))
+
+    stored, failed = dropbox_storage(dbx)
+    assert (stored, failed) == (1, 3)       # The upload is stored, the download batch conflicts
+    assert Download.query.count() == 0
+    for path in copies:
+        assert entry(path).state == 'failed'
+        assert entry(path).error.startswith('store')
@@ -0,0 +1,9 @@
+# Dashboard pages - dates outside the representable range are bad input, not server errors
+
+def test_range_past_the_last_date_redirects(client):
+    response = client.get('/data/range?start=2022-08-01&end=9999-12-31')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/index')
+
+def test_last_representable_day_is_not_found(client):
+    assert client.get('/data/9999/12/31').status_code == 404
@@ -0,0 +1,64 @@
+# Dropbox sync - new files, files already stored and an expired listing cursor, against an in-memory Dropbox folder
+from datetime import datetime
+
+from app import db
+from app.database import dropbox_storage
+from app.models import Download, Upload, SyncState, IngestFile
+from app.sources import CURSOR_KEY
+from benchmarks.corpus import archive, ndt7_file, ndt7_filename
+from tests.fake_dropbox import FakeDropbox
+
+def stored():       # Number of stored download and upload tests
+    return Download.query.count() + Upload.query.count()
+
+def upload(dbx, direction, start):      # Adds a new NDT7 file to the fake folder, returns its filename
+    filename = ndt7_filename(direction, start)
+    dbx.add('/ndt-server/datadir/ndt7/{:%Y/%m/%d}/{}'.format(start, filename), ndt7_file(direction, start))
+    return filename
+
+def test_first_sync_stores_every_file(app):
+    dbx = FakeDropbox(archive(2, 3, dropped=0))
+    assert dropbox_storage(dbx) == (12, 0)
+    assert Download.query.count() == 6
+    assert Upload.query.count() == 6
+    assert IngestFile.query.filter_by(state='stored').count() == 12
+    assert SyncState.query.get(CURSOR_KEY) is not None
+
+def test_second_sync_without_changes_stores_nothing(app):
+    dbx = FakeDropbox(archive(1, 3))
+    dropbox_storage(dbx)
+    downloads = dbx.calls['files_download']
+
+    assert dropbox_storage(dbx) == (0, 0)
+    assert stored() == 6
+    assert dbx.calls['files_download'] == downloads
+
+    # Only the file added since is fetched by the next run
+    filename = upload(dbx, 'upload', datetime(2022, 8, 2, 9))
+    assert dropbox_storage(dbx) == (1, 0)
+    assert Upload.query.filter_by(filename=filename).count() == 1
+    assert dbx.calls['files_download'] == downloads + 1
+
+def test_known_filenames_are_not_downloaded(app):
+    dbx = FakeDropbox(archive(1, 2, dropped=0))
+    known = [display for display, content in dbx.files.values() if '-download-' in display][0]
+    db.session.add(Download(filename=known.rsplit('/', 1)[1], timestamp=datetime(2022, 8, 1)))
+    db.session.commit()
+
+    assert dropbox_storage(dbx) == (3, 0)
+    assert dbx.calls['files_download'] == 3
+    assert Download.query.count() == 2
+
+def test_rejected_cursor_falls_back_to_a_full_listing(app):
+    dbx = FakeDropbox(archive(1, 2))
+    dropbox_storage(dbx)
+    SyncState.query.get(CURSOR_KEY).value = 'expired'
+    db.session.commit()
+    listings = dbx.calls['files_list_folder']
+
+    filename = upload(dbx, 'download', datetime(2022, 8, 2, 9))
+    assert dropbox_storage(dbx) == (1, 0)
+    assert dbx.calls['files_list_folder'] == listings + 1
+    assert Download.query.filter_by(filename=filename).count() == 1
+    assert stored() == 5
+    assert SyncState.query.get(CURSOR_KEY).value != 'expired'